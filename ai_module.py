@@ -4,21 +4,1718 @@ No predefined content - Everything generated by AI
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+import aiohttp
+import asyncio
 import json
 import os
-from typing import Dict, List, Optional, Tuple
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
 import time
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from bisect import bisect_right
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit
+from types import MappingProxyType
+from string import Formatter
 import streamlit as st
 import random
 from datetime import datetime
 import hashlib
+import re
+import numpy as np
+import zlib
+
+# Keep-alive connection pool sizes per provider host
+POOL_SIZES = {
+    'openrouter.ai': 16,
+    'api-inference.huggingface.co': 8,
+    'api.together.xyz': 8
+}
+DEFAULT_POOL_SIZE = 4
+
+class ConnectionPool:
+    """Thread-safe pool of keep-alive HTTP sessions, one per host, shared by all sessions in the process"""
+    
+    def __init__(self, pool_sizes: Dict[str, int] = None, default_size: int = DEFAULT_POOL_SIZE):
+        self.pool_sizes = dict(POOL_SIZES if pool_sizes is None else pool_sizes)
+        self.default_size = default_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+    
+    def session_for(self, url: str) -> requests.Session:
+        """Get (or lazily create) the pooled session for the host of url"""
+        
+        host = urlsplit(url).hostname or ''
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+        
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                size = self.pool_sizes.get(host, self.default_size)
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=size)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Connection'] = 'keep-alive'
+                self._sessions[host] = session
+        
+        return session
+    
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST through the pooled session for this host"""
+        return self.session_for(url).post(url, **kwargs)
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET through the pooled session for this host"""
+        return self.session_for(url).get(url, **kwargs)
+    
+    def stats(self) -> Dict[str, Dict]:
+        """Pool hit/miss stats per host (hit = request on a reused connection)"""
+        
+        with self._lock:
+            sessions = list(self._sessions.items())
+        
+        report = {}
+        for host, session in sessions:
+            requests_sent = 0
+            connections_opened = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for pool_key in list(pools.keys()):
+                    try:
+                        pool = pools[pool_key]
+                    except KeyError:
+                        continue
+                    requests_sent += pool.num_requests
+                    connections_opened += pool.num_connections
+            
+            report[host] = {
+                'pool_size': self.pool_sizes.get(host, self.default_size),
+                'requests': requests_sent,
+                'hits': max(requests_sent - connections_opened, 0),
+                'misses': connections_opened
+            }
+        
+        return report
+    
+    def close(self):
+        """Close all pooled sessions"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+# One pool per process, reused across Streamlit sessions and reruns; only the sync
+# translate_text path uses it, provider calls go through async_http on the engine loop
+http_pool = ConnectionPool()
+
+class EngineLoop:
+    """Background asyncio loop shared by every session; sync callers block on its futures"""
+    
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running engine loop, started on first use"""
+        
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='linguaflow-engine', daemon=True)
+                self._thread.start()
+            return self._loop
+    
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the engine loop and wait for its result (cancelled on timeout)"""
+        
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("EngineLoop.run() called from the engine loop; await the coroutine instead")
+        
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop())
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+    
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """Drive an async generator from sync code, one item per engine round-trip"""
+        
+        loop = self.loop()
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            # Consumer stopped early: let the generator close its HTTP stream
+            asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+# All async provider I/O for the process runs on this one loop
+engine_loop = EngineLoop()
+
+class AsyncHTTPClient:
+    """Keep-alive aiohttp sessions per host on the engine loop, with connection reuse stats"""
+    
+    def __init__(self, pool_sizes: Dict[str, int] = None, default_size: int = DEFAULT_POOL_SIZE):
+        self.pool_sizes = dict(POOL_SIZES if pool_sizes is None else pool_sizes)
+        self.default_size = default_size
+        self._sessions = {}
+        self._stats = {}
+        self.mode = 'live'     # 'live', 'record' (live + save answers) or 'replay' (answers from fixtures only)
+        self.fixtures = None
+    
+    def set_mode(self, mode: str, fixtures: Optional['FixtureStore'] = None):
+        """Switch between live calls, recording them to a fixture store, and offline replay"""
+        if mode not in ('live', 'record', 'replay'):
+            raise ValueError(f"Unknown provider mode: {mode}")
+        if mode != 'live' and fixtures is None:
+            raise ValueError(f"Provider mode '{mode}' needs a fixture store")
+        self.mode = mode
+        self.fixtures = fixtures
+    
+    def _session(self, url: str) -> aiohttp.ClientSession:
+        """Per-host session, created lazily inside the engine loop"""
+        
+        host = urlsplit(url).hostname or ''
+        session = self._sessions.get(host)
+        if session is not None and not session.closed:
+            return session
+        
+        stats = self._stats.setdefault(host, {'hits': 0, 'misses': 0})
+        
+        async def on_new_connection(session, ctx, params):
+            stats['misses'] += 1
+        
+        async def on_reused_connection(session, ctx, params):
+            stats['hits'] += 1
+        
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_new_connection)
+        trace.on_connection_reuseconn.append(on_reused_connection)
+        
+        size = self.pool_sizes.get(host, self.default_size)
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=size, keepalive_timeout=60),
+            trace_configs=[trace]
+        )
+        self._sessions[host] = session
+        return session
+    
+    async def post_json(self, url: str, headers: Dict, payload: Dict, timeout: float):
+        """POST a JSON body and return the decoded JSON answer (raises on HTTP errors)"""
+        
+        if self.mode == 'replay':
+            return self.fixtures.replay(url, payload)['body']
+        
+        async with self._session(url).post(
+            url,
+            headers=headers,
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            response.raise_for_status()
+            body = await response.json(content_type=None)
+        
+        if self.mode == 'record':
+            self.fixtures.record(url, payload, body=body)
+        return body
+    
+    async def stream_lines(self, url: str, headers: Dict, payload: Dict, timeout: float) -> AsyncIterator[str]:
+        """POST and yield the response body line by line as it arrives (for SSE)"""
+        
+        if self.mode == 'replay':
+            for line in self.fixtures.replay(url, payload)['lines']:
+                yield line
+            return
+        
+        lines = []
+        complete = False
+        try:
+            async with self._session(url).post(
+                url,
+                headers=headers,
+                json=payload,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+            ) as response:
+                response.raise_for_status()
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+                    lines.append(line)
+                    yield line
+            complete = True
+        finally:
+            # Only complete streams are worth replaying (readers stop at the SSE end marker)
+            if self.mode == 'record' and lines and (complete or lines[-1].strip() == 'data: [DONE]'):
+                self.fixtures.record(url, payload, lines=lines)
+    
+    async def close(self):
+        """Close all sessions (call on the engine loop)"""
+        for session in list(self._sessions.values()):
+            await session.close()
+        self._sessions.clear()
+    
+    def stats(self) -> Dict[str, Dict]:
+        """Pool hit/miss stats per host, same shape as ConnectionPool.stats()"""
+        return {
+            host: {
+                'pool_size': self.pool_sizes.get(host, self.default_size),
+                'requests': stats['hits'] + stats['misses'],
+                'hits': stats['hits'],
+                'misses': stats['misses']
+            }
+            for host, stats in list(self._stats.items())
+        }
+
+async_http = AsyncHTTPClient()
+
+def _shutdown_engine():
+    """Close pooled async connections on interpreter exit"""
+    if engine_loop._loop is not None and engine_loop._loop.is_running():
+        try:
+            engine_loop.run(async_http.close(), timeout=5)
+        except Exception:
+            pass
+
+atexit.register(_shutdown_engine)
+
+# Provider dispatch: 'sequential' tries providers one after another,
+# 'hedged' races the next provider once the leader is slower than its p95
+DEFAULT_DISPATCH_MODE = 'hedged'
+DEFAULT_HEDGE_DELAY = 4.0  # Seconds, used until a provider has latency samples
+
+# End-to-end time budget per generation: every attempt only gets what is left
+DEFAULT_GENERATION_TIMEOUT = 25.0  # Seconds from request to answer (page latency SLO)
+PROCEDURAL_RESERVE = 0.5            # Seconds held back for the procedural fallback
+PROVIDER_TIMEOUT = 20.0             # Upper bound for a single model attempt
+MIN_ATTEMPT_TIME = 1.0              # Don't start an attempt with less time than this left
+REPAIR_MARGIN = 0.5                 # Seconds a repair call leaves so the partial lesson still goes out
+
+def time_left(deadline: float) -> float:
+    """Seconds until an absolute deadline (never negative)"""
+    return max(deadline - time.time(), 0.0)
+
+def attempt_timeout(deadline: float) -> float:
+    """Timeout for one model attempt: the per-attempt cap or whatever is left, whichever is less"""
+    return min(PROVIDER_TIMEOUT, time_left(deadline))
+PROVIDER_ORDER = ['openrouter', 'huggingface', 'together']  # Tie-break order before any telemetry
+STREAMING_PROVIDERS = {'openrouter', 'together'}             # OpenAI-compatible SSE endpoints
+
+# Local state that should survive restarts (scores, caches, ledgers)
+CACHE_DIR = Path(os.environ.get('LINGUAFLOW_CACHE_DIR', '.linguaflow'))
+
+# Offline provider modes, for load tests without the real (rate-limited) endpoints:
+#   LINGUAFLOW_PROVIDER_MODE=record   call live providers and save every answer as a fixture
+#   LINGUAFLOW_PROVIDER_MODE=replay   answer from saved fixtures only, no network at all
+#   LINGUAFLOW_PROVIDER_BASE_URL=...  send all provider traffic to a stand-in (mock_provider_server.py)
+PROVIDER_MODE = os.environ.get('LINGUAFLOW_PROVIDER_MODE', 'live')
+PROVIDER_BASE_URL = os.environ.get('LINGUAFLOW_PROVIDER_BASE_URL', '')
+FIXTURE_DIR = Path(os.environ.get('LINGUAFLOW_FIXTURE_DIR', CACHE_DIR / 'fixtures'))
+OFFLINE_API_KEY = 'offline'  # Placeholder key so providers count as configured offline
+
+# Offline and stand-in runs keep scores, budgets and cached text apart from live ones,
+# so a load test never skews live routing, spends the real ledger or serves mock text
+OFFLINE_RUN = PROVIDER_MODE != 'live' or bool(PROVIDER_BASE_URL)
+STATE_DIR = CACHE_DIR / 'offline' / ('stand-in' if PROVIDER_BASE_URL else PROVIDER_MODE) if OFFLINE_RUN else CACHE_DIR
+
+# One background thread writes scores, ledgers and cached text, in order, so no
+# file write or os.replace ever runs on the engine loop
+state_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='linguaflow-state')
+
+# Scoring: expected seconds lost per attempt, lower is better
+SCORE_ALPHA = 0.2           # EWMA weight of the newest observation
+SCORE_PRIOR_LATENCY = 3.0   # Optimistic guess for candidates never tried
+ERROR_PENALTY = 20.0        # A failed call usually costs a full timeout
+EMPTY_PENALTY = 10.0        # An empty answer costs a call and another attempt
+
+class ProviderScorer:
+    """Online EWMA latency / error / empty-response scores per (provider, model), persisted to disk"""
+    
+    def __init__(self, path: Optional[Path] = None, window: int = 100, save_interval: float = 30.0):
+        self.path = path
+        self.window = window
+        self.save_interval = save_interval
+        self._stats = {}       # (provider, model) -> {'latency', 'error_rate', 'empty_rate', 'calls'}
+        self._latencies = {}   # provider -> recent successful call latencies (for hedging p95)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = time.time()
+        self.load()
+    
+    def record(self, provider: str, model: str, seconds: float, outcome: str):
+        """Record one model attempt; outcome is 'ok', 'empty' or 'error'"""
+        
+        observed = {
+            'error_rate': 1.0 if outcome == 'error' else 0.0,
+            'empty_rate': 1.0 if outcome == 'empty' else 0.0
+        }
+        
+        with self._lock:
+            stats = self._stats.get((provider, model))
+            if stats is None:
+                stats = {'latency': seconds if outcome != 'error' else SCORE_PRIOR_LATENCY, 'calls': 0}
+                stats.update(observed)
+                self._stats[(provider, model)] = stats
+            else:
+                # Errors often return instantly, so only answers move the latency estimate
+                if outcome != 'error':
+                    stats['latency'] += SCORE_ALPHA * (seconds - stats['latency'])
+                for field, value in observed.items():
+                    stats[field] += SCORE_ALPHA * (value - stats[field])
+            stats['calls'] += 1
+            self._dirty = True
+        
+        self.maybe_save()
+    
+    def record_call(self, provider: str, seconds: float):
+        """Record the latency of a successful provider call"""
+        with self._lock:
+            if provider not in self._latencies:
+                self._latencies[provider] = deque(maxlen=self.window)
+            self._latencies[provider].append(seconds)
+            self._dirty = True
+    
+    def score(self, provider: str, model: str) -> float:
+        """Expected cost in seconds of trying this model next"""
+        
+        stats = self._stats.get((provider, model))
+        if stats is None:
+            return SCORE_PRIOR_LATENCY
+        
+        return (stats['latency']
+                + stats['error_rate'] * ERROR_PENALTY
+                + stats['empty_rate'] * EMPTY_PENALTY)
+    
+    def rank_models(self, provider: str, models: List[str]) -> List[str]:
+        """Models of one provider, best score first (ties keep configured order)"""
+        return sorted(models, key=lambda model: self.score(provider, model))
+    
+    def rank_providers(self, provider_models: Dict[str, List[str]]) -> List[str]:
+        """Providers ordered by the score of their best model"""
+        return sorted(
+            provider_models,
+            key=lambda name: min((self.score(name, m) for m in provider_models[name]), default=SCORE_PRIOR_LATENCY)
+        )
+    
+    def percentile(self, provider: str, pct: float, default: float = None) -> Optional[float]:
+        """Successful call latency percentile (0-100), or default without samples"""
+        
+        with self._lock:
+            samples = sorted(self._latencies.get(provider, ()))
+        
+        if not samples:
+            return default
+        
+        index = min(int(round(pct / 100 * (len(samples) - 1))), len(samples) - 1)
+        return samples[index]
+    
+    def p95(self, provider: str, default: float = None) -> Optional[float]:
+        return self.percentile(provider, 95, default)
+    
+    def snapshot(self) -> List[Dict]:
+        """Current scores for display, best first"""
+        
+        with self._lock:
+            rows = [
+                dict(stats, provider=provider, model=model)
+                for (provider, model), stats in self._stats.items()
+            ]
+        
+        for row in rows:
+            row['score'] = self.score(row['provider'], row['model'])
+        
+        return sorted(rows, key=lambda row: row['score'])
+    
+    def load(self):
+        """Load persisted scores, ignoring a missing or corrupt file"""
+        
+        if not self.path or not self.path.exists():
+            return
+        
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            
+            with self._lock:
+                for row in data.get('models', []):
+                    self._stats[(row['provider'], row['model'])] = {
+                        'latency': float(row['latency']),
+                        'error_rate': float(row['error_rate']),
+                        'empty_rate': float(row['empty_rate']),
+                        'calls': int(row.get('calls', 0))
+                    }
+                for provider, samples in data.get('latencies', {}).items():
+                    self._latencies[provider] = deque(samples, maxlen=self.window)
+        except Exception as e:
+            print(f"Could not load provider scores: {e}")
+    
+    def save(self):
+        """Write scores atomically to disk"""
+        
+        if not self.path:
+            return
+        
+        with self._lock:
+            data = {
+                'models': [
+                    dict(stats, provider=provider, model=model)
+                    for (provider, model), stats in self._stats.items()
+                ],
+                'latencies': {provider: list(samples) for provider, samples in self._latencies.items()}
+            }
+            self._dirty = False
+            self._last_save = time.time()
+        
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Could not save provider scores: {e}")
+    
+    def maybe_save(self):
+        """Save in the background if something changed and the last save is older than save_interval"""
+        with self._lock:
+            due = self._dirty and time.time() - self._last_save >= self.save_interval
+            if due:
+                self._last_save = time.time()  # Queue one save, not one per call until it runs
+        if due:
+            state_writer.submit(self.save)
+
+provider_scorer = ProviderScorer(STATE_DIR / 'provider_scores.json')
+atexit.register(provider_scorer.save)
+
+# Circuit breakers per (provider, model): skip endpoints that keep failing
+BREAKER_FAILURE_THRESHOLD = 3  # Consecutive failures before the breaker opens
+BREAKER_COOLDOWN = 60.0        # Seconds open before one half-open probe is let through
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for a single endpoint"""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Whether a call may go out now; reserves the probe slot when half-open"""
+        
+        with self._lock:
+            now = time.time()
+            if self.state == self.CLOSED:
+                return True
+            
+            if self.state == self.OPEN and now - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self.probe_started = 0.0
+            
+            # Half-open lets one probe through; a probe that never reported back expires
+            if self.state == self.HALF_OPEN and now - self.probe_started >= self.cooldown:
+                self.probe_started = now
+                return True
+            
+            return False
+    
+    def release(self):
+        """Hand back a probe slot reserved by allow() for a call that never went out"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.probe_started = 0.0
+    
+    def available(self) -> bool:
+        """Non-reserving check: closed, or due for a probe"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.time() - self.opened_at >= self.cooldown
+            return time.time() - self.probe_started >= self.cooldown
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+    
+    def retry_in(self) -> float:
+        """Seconds until an open breaker lets a probe through"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.cooldown - (time.time() - self.opened_at), 0.0)
+
+class BreakerRegistry:
+    """Process-wide circuit breakers keyed by (provider, model)"""
+    
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._breakers = {}
+        self._lock = threading.Lock()
+    
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(self.failure_threshold, self.cooldown))
+        return breaker
+    
+    def configure(self, failure_threshold: int = None, cooldown: float = None):
+        """Change thresholds for existing and future breakers"""
+        with self._lock:
+            if failure_threshold is not None:
+                self.failure_threshold = failure_threshold
+            if cooldown is not None:
+                self.cooldown = cooldown
+            for breaker in self._breakers.values():
+                breaker.failure_threshold = self.failure_threshold
+                breaker.cooldown = self.cooldown
+    
+    def any_available(self, provider: str, models: List[str]) -> bool:
+        return any(self.get(provider, model).available() for model in models)
+    
+    def snapshot(self) -> List[Dict]:
+        """Breaker states for display"""
+        with self._lock:
+            items = list(self._breakers.items())
+        return [
+            {
+                'provider': provider,
+                'model': model,
+                'state': breaker.state,
+                'failures': breaker.failures,
+                'retry_in': round(breaker.retry_in(), 1)
+            }
+            for (provider, model), breaker in sorted(items)
+        ]
+
+circuit_breakers = BreakerRegistry()
+
+# Opt-in generation cache, shared by all sessions and persisted under STATE_DIR
+CACHE_VARIANTS = 3                      # Variants kept and rotated per request key
+CACHE_TTL = 7 * 24 * 3600               # Seconds before a cached variant is stale
+CACHE_MAX_BYTES = 50 * 1024 * 1024      # On-disk size cap, least recently used evicted first
+CACHEABLE_CONTENT_TYPES = {'reading', 'listening', 'grammar', 'speaking', 'writing', 'daily_bundle',
+                           'examples', 'recommendation'}
+
+def is_cacheable(content_type: str) -> bool:
+    """Learner-independent content only; tutor replies, corrections and evaluations are personal"""
+    return content_type in CACHEABLE_CONTENT_TYPES or (content_type.startswith('exam_') and content_type != 'exam_evaluation')
+
+def _normalize_for_key(value):
+    """Case/whitespace-insensitive, order-stable form of a request context"""
+    if isinstance(value, str):
+        return ' '.join(value.lower().split())
+    if isinstance(value, dict):
+        return {str(k): _normalize_for_key(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_for_key(v) for v in value]
+    return value
+
+class GenerationCache:
+    """Content-addressed on-disk cache of generated text with LRU + TTL eviction and a size cap
+    
+    Entries are mirrored in memory, so get() never touches the disk; writes, deletes and
+    access-time updates all go through state_writer, off the engine loop.
+    """
+    
+    def __init__(self, directory: Path, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL,
+                 variants: int = CACHE_VARIANTS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.variants = variants
+        self._index = OrderedDict()  # entry name -> (size in bytes, created, text), least recently used first
+        self._total_bytes = 0
+        self._rotation = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        state_writer.submit(self._load_index)  # Ahead of any put(): the writer runs jobs in order
+    
+    @staticmethod
+    def make_key(content_type: str, level: str, topic: str, context: Dict = None) -> str:
+        """Stable key for (content_type, level, topic, normalized context)"""
+        payload = json.dumps(
+            _normalize_for_key([content_type, level, topic, context or {}]),
+            sort_keys=True, default=str, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    def next_slot(self, key: str) -> int:
+        """Rotate through the variant slots of a key so learners still see variety"""
+        with self._lock:
+            slot = self._rotation.get(key, 0)
+            self._rotation[key] = (slot + 1) % self.variants
+        return slot
+    
+    def get(self, key: str, slot: int) -> Optional[str]:
+        """Cached text for this variant slot, or None if missing or expired"""
+        
+        name = f"{key}_{slot}"
+        with self._lock:
+            entry = self._index.get(name)
+            if entry is not None:
+                self._index.move_to_end(name)
+        
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        _, created, text = entry
+        if time.time() - created > self.ttl:
+            self._remove(name)
+            self.misses += 1
+            return None
+        
+        state_writer.submit(self._touch, name)  # mtime doubles as last-access time across restarts
+        self.hits += 1
+        return text
+    
+    def put(self, key: str, slot: int, text: str):
+        """Store a variant and evict least recently used entries over the size cap"""
+        
+        name = f"{key}_{slot}"
+        created = time.time()
+        payload = json.dumps({'created': created, 'text': text}, ensure_ascii=False)
+        
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{name}.json"
+            tmp_path = self.directory / f"{name}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Could not write generation cache: {e}")
+            return
+        
+        size = len(payload.encode('utf-8'))
+        with self._lock:
+            old = self._index.pop(name, None)
+            self._total_bytes += size - (old[0] if old else 0)
+            self._index[name] = (size, created, text)
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._index) > 1:
+                old_name, (old_size, _, _) = self._index.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_name)
+        
+        for old_name in evicted:
+            self._unlink(old_name)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._index),
+                'bytes': self._total_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+    
+    def clear(self):
+        with self._lock:
+            names = list(self._index)
+            self._index.clear()
+            self._total_bytes = 0
+        for name in names:
+            self._unlink(name)
+    
+    def _load_index(self):
+        """Rebuild the LRU index and its texts from files on disk, oldest access first"""
+        
+        if not self.directory.exists():
+            return
+        
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    stat = entry.stat()
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    entries.append((stat.st_mtime, entry.name[:-5], stat.st_size, data['created'], data['text']))
+                except Exception:
+                    self._unlink(entry.name[:-5])
+        
+        with self._lock:
+            for _, name, size, created, text in sorted(entries, key=lambda entry: entry[0]):
+                if name not in self._index:  # Never replace an entry stored meanwhile
+                    self._index[name] = (size, created, text)
+                    self._total_bytes += size
+    
+    def _remove(self, name: str):
+        with self._lock:
+            entry = self._index.pop(name, None)
+            if entry:
+                self._total_bytes -= entry[0]
+        state_writer.submit(self._unlink, name)
+    
+    def _touch(self, name: str):
+        try:
+            os.utime(self.directory / f"{name}.json")
+        except OSError:
+            pass
+    
+    def _unlink(self, name: str):
+        try:
+            (self.directory / f"{name}.json").unlink()
+        except OSError:
+            pass
+
+generation_cache = GenerationCache(STATE_DIR / 'generations')
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one upstream call whose result is shared"""
+    
+    def __init__(self):
+        self._flights = {}  # key -> upstream task (all access happens on the engine loop)
+        self.leaders = 0    # Calls that went upstream
+        self.followers = 0  # Calls that waited on a leader instead
+    
+    async def do(self, key: str, fn, follower_shortcut=None) -> Tuple[Optional[str], bool]:
+        """Run fn() once per key at a time; returns (result, shared)
+        
+        A follower first tries follower_shortcut() and only waits on the leader if it returns nothing.
+        The upstream task is shielded, so one caller giving up does not cancel it for the others.
+        """
+        
+        task = self._flights.get(key)
+        if task is not None:
+            self.followers += 1
+            if follower_shortcut is not None:
+                shortcut = follower_shortcut()
+                if shortcut:
+                    return shortcut, True
+            return await asyncio.shield(task), True
+        
+        self.leaders += 1
+        task = asyncio.ensure_future(fn())
+        self._flights[key] = task
+        task.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(task), False
+    
+    def stats(self) -> Dict:
+        return {'upstream_calls': self.leaders, 'coalesced': self.followers, 'in_flight': len(self._flights)}
+
+# Identical in-flight generations across all sessions share one upstream call
+inflight_requests = SingleFlight()
+
+# Client-side rate limits and daily budgets (free-tier keys have hard caps)
+PROVIDER_LIMITS = {
+    'openrouter': {'rpm': 20, 'daily': 200},
+    'huggingface': {'rpm': 30, 'daily': 1000},
+    'together': {'rpm': 60, 'daily': 1000}
+}
+USER_LIMITS = {'rpm': 12, 'daily': 300}  # Logical generations per learner
+BUDGET_QUEUE_WAIT = 5.0                 # Seconds a request may queue for a rate-limit token
+BUDGET_ECONOMY_SHARE = 0.8              # Past this share of a daily budget, one economy model per request
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute"""
+    
+    def __init__(self, rate_per_minute: float, burst: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(rate_per_minute, 1.0)  # A minute's worth by default
+        self.tokens = self.capacity
+        self.updated = time.time()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def _take(self) -> Optional[float]:
+        """Take a token now (None) or return how long until one refills"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return None
+            return (1.0 - self.tokens) / self.rate if self.rate > 0 else float('inf')
+    
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """Take a token, waiting up to timeout seconds for one to refill"""
+        
+        deadline = time.time() + timeout
+        while True:
+            wait_for = self._take()
+            if wait_for is None:
+                return True
+            if time.time() + wait_for > deadline:
+                return False
+            time.sleep(wait_for)
+    
+    async def acquire_async(self, timeout: float = 0.0) -> bool:
+        """acquire() for the engine loop: waits without blocking other requests"""
+        
+        deadline = time.time() + timeout
+        while True:
+            wait_for = self._take()
+            if wait_for is None:
+                return True
+            if time.time() + wait_for > deadline:
+                return False
+            await asyncio.sleep(wait_for)
+    
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+class RequestGovernor:
+    """Rate limiters per provider key and per learner, plus a persisted daily budget ledger"""
+    
+    def __init__(self, ledger_path: Optional[Path] = None, provider_limits: Dict = None,
+                 user_limits: Dict = None, queue_wait: float = BUDGET_QUEUE_WAIT):
+        self.ledger_path = ledger_path
+        self.provider_limits = provider_limits or PROVIDER_LIMITS
+        self.user_limits = user_limits or USER_LIMITS
+        self.queue_wait = queue_wait
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._ledger = {'date': self._today(), 'providers': {}, 'users': {}}
+        self._last_save = 0.0
+        self._load()
+    
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().date().isoformat()
+    
+    @staticmethod
+    def key_id(provider: str, api_key: str) -> str:
+        """Ledger id for a provider key without storing the key itself"""
+        return f"{provider}:{hashlib.sha256(api_key.encode()).hexdigest()[:12]}"
+    
+    def _bucket(self, name: str, rpm: float) -> TokenBucket:
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = TokenBucket(rpm)
+            return self._buckets[name]
+    
+    def _used(self, section: str, name: str) -> int:
+        with self._lock:
+            if self._ledger['date'] != self._today():
+                self._ledger = {'date': self._today(), 'providers': {}, 'users': {}}
+            return self._ledger[section].get(name, 0)
+    
+    def _charge(self, section: str, name: str):
+        with self._lock:
+            self._ledger[section][name] = self._ledger[section].get(name, 0) + 1
+            due = time.time() - self._last_save >= 10.0
+            if due:
+                self._last_save = time.time()
+        if due:
+            state_writer.submit(self.save)
+    
+    async def admit_user(self, user: str, max_wait: Optional[float] = None) -> bool:
+        """Admit one logical generation for a learner, queueing briefly for the rate limit"""
+        
+        if self._used('users', user) >= self.user_limits['daily']:
+            return False
+        if not await self._bucket(f"user:{user}", self.user_limits['rpm']).acquire_async(self._wait(max_wait)):
+            return False
+        
+        self._charge('users', user)
+        return True
+    
+    async def acquire_provider(self, provider: str, api_key: str, max_wait: Optional[float] = None) -> bool:
+        """Admit one upstream HTTP call on this provider key"""
+        
+        limits = self.provider_limits.get(provider)
+        if not limits:
+            return True
+        
+        key_id = self.key_id(provider, api_key)
+        if self._used('providers', key_id) >= limits['daily']:
+            return False
+        if not await self._bucket(key_id, limits['rpm']).acquire_async(self._wait(max_wait)):
+            return False
+        
+        self._charge('providers', key_id)
+        return True
+    
+    def _wait(self, max_wait: Optional[float]) -> float:
+        """Queueing time allowed: the configured wait, capped by the caller's remaining budget"""
+        return self.queue_wait if max_wait is None else max(min(self.queue_wait, max_wait), 0.0)
+    
+    def economy(self, provider: str, api_key: str) -> bool:
+        """Whether this key is far enough into its daily budget to use only its economy model"""
+        limits = self.provider_limits.get(provider)
+        if not limits:
+            return False
+        return self._used('providers', self.key_id(provider, api_key)) >= limits['daily'] * BUDGET_ECONOMY_SHARE
+    
+    def usage(self, user: str, api_keys: Dict[str, str]) -> List[Dict]:
+        """Today's budget use for a learner and their configured provider keys"""
+        
+        rows = [{
+            'name': f"You ({user})",
+            'used': self._used('users', user),
+            'daily': self.user_limits['daily'],
+            'tokens': round(self._bucket(f"user:{user}", self.user_limits['rpm']).available(), 1)
+        }]
+        
+        for provider, limits in self.provider_limits.items():
+            api_key = api_keys.get(provider, '')
+            if api_key:
+                key_id = self.key_id(provider, api_key)
+                rows.append({
+                    'name': provider,
+                    'used': self._used('providers', key_id),
+                    'daily': limits['daily'],
+                    'tokens': round(self._bucket(key_id, limits['rpm']).available(), 1)
+                })
+        
+        return rows
+    
+    def _load(self):
+        if not self.ledger_path or not self.ledger_path.exists():
+            return
+        try:
+            with open(self.ledger_path, 'r') as f:
+                ledger = json.load(f)
+            if ledger.get('date') == self._today():
+                self._ledger = ledger
+        except Exception as e:
+            print(f"Could not load budget ledger: {e}")
+    
+    def save(self):
+        """Write the ledger atomically to disk"""
+        
+        if not self.ledger_path:
+            return
+        
+        with self._lock:
+            data = json.dumps(self._ledger)
+            self._last_save = time.time()
+        
+        try:
+            self.ledger_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.ledger_path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.ledger_path)
+        except Exception as e:
+            print(f"Could not save budget ledger: {e}")
+
+request_governor = RequestGovernor(STATE_DIR / 'budget_ledger.json')
+atexit.register(request_governor.save)
+
+class ReplayMiss(LookupError):
+    """No recorded fixture matches a request in replay mode"""
+
+class FixtureStore:
+    """Recorded provider answers on disk, one JSON file per (endpoint path, request body)"""
+    
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._by_model = None  # (path, model) -> fixture keys, built on first loose lookup
+        self._turns = {}
+    
+    @staticmethod
+    def make_key(url: str, payload: Dict) -> str:
+        """Hash of the endpoint path (not the host) and the canonical request body"""
+        material = json.dumps({'path': urlsplit(url).path, 'payload': payload}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _model(url: str, payload: Dict) -> str:
+        """Chat endpoints name the model in the body, HuggingFace in the URL"""
+        return payload.get('model') or urlsplit(url).path.rsplit('/models/', 1)[-1]
+    
+    def record(self, url: str, payload: Dict, body=None, lines: Optional[List[str]] = None):
+        """Save one answer: a decoded JSON body, or the raw lines of a stream"""
+        
+        key = self.make_key(url, payload)
+        fixture = {
+            'path': urlsplit(url).path,
+            'model': self._model(url, payload),
+            'stream': lines is not None,
+            'payload': payload,
+            'recorded_at': time.time()
+        }
+        if lines is not None:
+            fixture['lines'] = lines
+        else:
+            fixture['body'] = body
+        
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f"{key}.tmp"
+            tmp.write_text(json.dumps(fixture, ensure_ascii=False), encoding='utf-8')
+            os.replace(tmp, self.directory / f"{key}.json")
+            self._by_model = None
+    
+    def replay(self, url: str, payload: Dict) -> Dict:
+        """Exact match first; otherwise rotate through fixtures of the same model and shape.
+        
+        Prompts carry a per-request seed, so a replayed run rarely repeats a recorded
+        body byte for byte - the loose match keeps load tests going anyway.
+        """
+        
+        path = self.directory / f"{self.make_key(url, payload)}.json"
+        if path.exists():
+            return json.loads(path.read_text(encoding='utf-8'))
+        
+        stream = bool(payload.get('stream'))
+        group = (urlsplit(url).path, self._model(url, payload), stream)
+        with self._lock:
+            if self._by_model is None:
+                self._by_model = self._index()
+            keys = self._by_model.get(group)
+            if not keys:
+                raise ReplayMiss(f"No fixture for {group[0]} ({group[1]})")
+            turn = self._turns.get(group, 0)
+            self._turns[group] = turn + 1
+            key = keys[turn % len(keys)]
+        
+        return json.loads((self.directory / f"{key}.json").read_text(encoding='utf-8'))
+    
+    def _index(self) -> Dict[Tuple, List[str]]:
+        """Group fixture keys by (path, model, stream)"""
+        
+        groups = {}
+        if not self.directory.exists():
+            return groups
+        for path in sorted(self.directory.glob('*.json')):
+            try:
+                fixture = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            group = (fixture.get('path'), fixture.get('model'), bool(fixture.get('stream')))
+            groups.setdefault(group, []).append(path.stem)
+        return groups
+    
+    def count(self) -> int:
+        """Number of recorded fixtures"""
+        return len(list(self.directory.glob('*.json'))) if self.directory.exists() else 0
+
+if PROVIDER_MODE != 'live':
+    async_http.set_mode(PROVIDER_MODE, FixtureStore(FIXTURE_DIR))
+
+def rebase_url(url: str, base: str) -> str:
+    """Keep the provider's endpoint path but send it to another host (the local stand-in)"""
+    return base.rstrip('/') + urlsplit(url).path
+
+# Offline curriculum bank (built by build_curriculum.py): pre-generated lesson texts
+# per (level, topic, skill), served before any live call. Topics change only at a few
+# day thresholds, so the bank holds a handful of variants per topic and rotates them by day.
+CURRICULUM_DIR = Path(os.environ.get('LINGUAFLOW_CURRICULUM_DIR', 'curriculum'))
+CURRICULUM_VERSION = 1
+
+class CurriculumBank:
+    """Compressed lesson texts in one blob file plus a JSON index of (offset, length) spans"""
+    
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.index_path = self.directory / 'index.json'
+        self.blob_path = self.directory / 'lessons.bin'
+        self._entries = None  # key -> [(offset, length), ...], loaded on first use
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def entry_key(level: str, topic: str, skill: str) -> str:
+        return f"{level}|{topic}|{skill}"
+    
+    def _index(self) -> Dict[str, List]:
+        """The span index, read once; a missing or unreadable bank is simply empty"""
+        
+        if self._entries is None:
+            with self._lock:
+                if self._entries is None:
+                    entries = {}
+                    try:
+                        index = json.loads(self.index_path.read_text(encoding='utf-8'))
+                        if index.get('version') == CURRICULUM_VERSION and self.blob_path.exists():
+                            entries = index.get('entries', {})
+                    except (OSError, ValueError):
+                        pass
+                    self._entries = entries
+        return self._entries
+    
+    def variants(self, level: str, topic: str, skill: str) -> int:
+        return len(self._index().get(self.entry_key(level, topic, skill), []))
+    
+    def get(self, level: str, topic: str, skill: str, day: int) -> Optional[str]:
+        """The variant for this day (consecutive days rotate through the variants), or None"""
+        
+        spans = self._index().get(self.entry_key(level, topic, skill))
+        if not spans:
+            self.misses += 1
+            return None
+        
+        offset, length = spans[day % len(spans)]
+        try:
+            with open(self.blob_path, 'rb') as f:
+                f.seek(offset)
+                text = zlib.decompress(f.read(length)).decode('utf-8')
+        except (OSError, zlib.error):
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return text
+    
+    def texts(self) -> Dict[str, List[str]]:
+        """Every stored text by entry key (for rebuilding or extending a bank)"""
+        
+        entries = self._index()
+        if not entries:
+            return {}
+        with open(self.blob_path, 'rb') as f:
+            blob = f.read()
+        return {
+            key: [zlib.decompress(blob[offset:offset + length]).decode('utf-8') for offset, length in spans]
+            for key, spans in entries.items()
+        }
+    
+    def write(self, texts: Dict[str, List[str]]):
+        """Replace the bank with these texts (blob first, then the index that points into it)"""
+        
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entries = {}
+        blob_tmp = self.blob_path.with_suffix('.tmp')
+        with open(blob_tmp, 'wb') as f:
+            for key in sorted(texts):
+                spans = []
+                for text in texts[key]:
+                    data = zlib.compress(text.encode('utf-8'), 9)
+                    spans.append((f.tell(), len(data)))
+                    f.write(data)
+                entries[key] = spans
+        
+        index_tmp = self.index_path.with_suffix('.tmp')
+        index_tmp.write_text(json.dumps({
+            'version': CURRICULUM_VERSION,
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+            'entries': entries
+        }), encoding='utf-8')
+        os.replace(blob_tmp, self.blob_path)
+        os.replace(index_tmp, self.index_path)
+        
+        with self._lock:
+            self._entries = None
+    
+    def stats(self) -> Dict[str, int]:
+        entries = self._index()
+        return {
+            'entries': len(entries),
+            'texts': sum(len(spans) for spans in entries.values()),
+            'bytes': self.blob_path.stat().st_size if entries else 0,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+curriculum_bank = CurriculumBank(CURRICULUM_DIR)
+
+# Topic path per level: {first day: topic}. LINGUAFLOW_CURRICULUM_MAP can point at a JSON
+# file of the same shape ({"A1": {"1": "...", "10": "..."}, ...}) to ship a longer path.
+CURRICULUM_MAP_FILE = os.environ.get('LINGUAFLOW_CURRICULUM_MAP', '')
+TOPIC_PROGRESSION = {
+    'A1': {
+        1: 'Greetings and Introductions',
+        10: 'Family and Friends',
+        20: 'Daily Routine',
+        30: 'Food and Drinks',
+        40: 'Shopping',
+        50: 'Home and Living',
+        60: 'Free Time'
+    },
+    'A2': {
+        1: 'Travel Planning',
+        10: 'At Work',
+        20: 'Health and Body',
+        30: 'Weather and Seasons',
+        40: 'Celebrations',
+        50: 'Past Experiences',
+        60: 'Future Plans'
+    },
+    'B1': {
+        1: 'Education System',
+        10: 'Environment',
+        20: 'Media and News',
+        30: 'Culture Differences',
+        40: 'Technology',
+        50: 'Sports and Fitness',
+        60: 'Career Development'
+    },
+    'B2': {
+        1: 'Global Issues',
+        10: 'Economics',
+        20: 'Politics',
+        30: 'Science',
+        40: 'Art and Literature',
+        50: 'Philosophy',
+        60: 'Future of Society'
+    }
+}
+
+class CurriculumMap:
+    """Topic progression compiled to sorted day thresholds per level, looked up by bisection"""
+    
+    def __init__(self, progression: Dict[str, Dict[int, str]], default_level: str = 'A1'):
+        self.levels = {}
+        for level, topics in progression.items():
+            thresholds = sorted((int(day), topic) for day, topic in topics.items())
+            if not thresholds:
+                raise ValueError(f"Curriculum level {level} has no topics")
+            self.levels[level] = (tuple(day for day, _ in thresholds), tuple(topic for _, topic in thresholds))
+        if not self.levels:
+            raise ValueError("Curriculum map has no levels")
+        self.default = self.levels[default_level if default_level in self.levels else next(iter(self.levels))]
+    
+    @classmethod
+    def load(cls, path) -> 'CurriculumMap':
+        """Compile a curriculum file: {"A1": {"1": "Greetings", "10": "Family"}, ...}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+    
+    def write(self, path):
+        """Save as a curriculum file, e.g. to start a longer path from the built-in one"""
+        data = {level: dict(zip(map(str, days), topics)) for level, (days, topics) in self.levels.items()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    def topic(self, level: str, day: int) -> str:
+        """Topic of the last threshold at or before day (days before the first get the first topic)"""
+        days, topics = self.levels.get(level, self.default)
+        return topics[max(bisect_right(days, day) - 1, 0)]
+    
+    def topics(self, level: str, days: Optional[int] = None) -> List[str]:
+        """Distinct topics of a level's path in order, those starting by the given day"""
+        thresholds, topics = self.levels.get(level, self.default)
+        reached = len(topics) if days is None else max(bisect_right(thresholds, days), 1)
+        return list(dict.fromkeys(topics[:reached]))
+
+def load_curriculum_map(path: str = CURRICULUM_MAP_FILE) -> CurriculumMap:
+    """The configured curriculum file, or the built-in path if none is set or it can't be read"""
+    if path:
+        try:
+            return CurriculumMap.load(path)
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            print(f"Could not load curriculum map {path}: {e}")
+    return CurriculumMap(TOPIC_PROGRESSION)
+
+curriculum_map = load_curriculum_map()
+
+# Dynamic vocabulary pools based on level, for procedural texts (read-only, shared by all calls)
+PROCEDURAL_VOCAB = MappingProxyType({
+    level: MappingProxyType({kind: tuple(words) for kind, words in pools.items()})
+    for level, pools in {
+        'A1': {
+            'verbs': ['sein', 'haben', 'machen', 'gehen', 'kommen', 'essen', 'trinken', 'wohnen', 'arbeiten', 'lernen'],
+            'nouns': ['Haus', 'Familie', 'Freund', 'Arbeit', 'Schule', 'Essen', 'Stadt', 'Tag', 'Zeit', 'Jahr'],
+            'adjectives': ['gut', 'schlecht', 'groß', 'klein', 'neu', 'alt', 'schön', 'teuer', 'billig', 'einfach'],
+            'connectors': ['und', 'aber', 'oder', 'denn', 'also']
+        },
+        'A2': {
+            'verbs': ['können', 'müssen', 'wollen', 'sollen', 'dürfen', 'mögen', 'brauchen', 'kaufen', 'verkaufen', 'reisen'],
+            'nouns': ['Urlaub', 'Reise', 'Hotel', 'Restaurant', 'Geschäft', 'Kunde', 'Problem', 'Lösung', 'Idee', 'Plan'],
+            'adjectives': ['interessant', 'langweilig', 'wichtig', 'möglich', 'schwierig', 'leicht', 'praktisch', 'modern', 'traditionell', 'typisch'],
+            'connectors': ['weil', 'wenn', 'dass', 'obwohl', 'nachdem', 'bevor']
+        },
+        'B1': {
+            'verbs': ['entwickeln', 'verbessern', 'erreichen', 'vermeiden', 'empfehlen', 'besprechen', 'entscheiden', 'vorstellen', 'bewerben', 'organisieren'],
+            'nouns': ['Entwicklung', 'Fortschritt', 'Gesellschaft', 'Umwelt', 'Zukunft', 'Vergangenheit', 'Erfahrung', 'Meinung', 'Vorschlag', 'Möglichkeit'],
+            'adjectives': ['nachhaltig', 'erfolgreich', 'verantwortlich', 'kreativ', 'flexibel', 'zuverlässig', 'effizient', 'notwendig', 'nützlich', 'problematisch'],
+            'connectors': ['sowohl...als auch', 'weder...noch', 'je...desto', 'entweder...oder', 'nicht nur...sondern auch']
+        },
+        'B2': {
+            'verbs': ['analysieren', 'diskutieren', 'argumentieren', 'kritisieren', 'interpretieren', 'präsentieren', 'evaluieren', 'implementieren', 'optimieren', 'koordinieren'],
+            'nouns': ['Analyse', 'Konzept', 'Strategie', 'Innovation', 'Globalisierung', 'Digitalisierung', 'Nachhaltigkeit', 'Kompetenz', 'Herausforderung', 'Perspektive'],
+            'adjectives': ['komplex', 'differenziert', 'kontrovers', 'innovativ', 'strategisch', 'fundamental', 'signifikant', 'relevant', 'authentisch', 'dynamisch'],
+            'connectors': ['darüber hinaus', 'infolgedessen', 'dennoch', 'folglich', 'einerseits...andererseits']
+        }
+    }.items()
+})
+
+# Bulk procedural reading texts (cache seeding, load tests): every sentence, title and
+# vocabulary line a level can produce is rendered once, so a text is only table lookups
+PROCEDURAL_READING_LAYOUT = """
+        TITLE: {}
+        
+        TEXT: {}
+        
+        VOCABULARY:
+        - {}: [translation]
+        - {}: [translation]
+        - {}: [translation]
+        - {}: [translation]
+        - {}: [translation]
+        
+        QUESTIONS:
+        1. Was ist das Hauptthema?
+        2. Welche Adjektive werden verwendet?
+        3. Was passiert im Text?
+        
+        CULTURAL_NOTE: This text reflects contemporary German life and language use.
+        """
+
+class ProceduralBulkGenerator:
+    """Many procedural reading texts at once, with all random picks drawn in one NumPy pass"""
+    
+    def __init__(self, vocab: Dict = None):
+        self.vocab = PROCEDURAL_VOCAB if vocab is None else vocab
+        self._sentences = {}  # level -> (sentence table, template offsets, template sizes)
+        self._titles = {}     # (level, topic) -> (title table, template offsets, template sizes)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _tables(templates: List[List[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Concatenate per-template renderings; a uniform pick within a template's span
+        equals drawing each of its slots uniformly, like the per-call generator"""
+        sizes = np.array([len(rendered) for rendered in templates])
+        offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        return np.array([text for rendered in templates for text in rendered], dtype=object), offsets, sizes
+    
+    def _sentence_tables(self, level: str):
+        with self._lock:
+            if level not in self._sentences:
+                pool = self.vocab.get(level, self.vocab['A1'])
+                verbs, nouns, adjectives = pool['verbs'], pool['nouns'], pool['adjectives']
+                self._sentences[level] = self._tables([
+                    [f"{p} {v} {a} {n}." for p in ['Ich', 'Du', 'Er', 'Sie', 'Wir']
+                     for v in verbs for a in adjectives for n in nouns],
+                    [f"{n} {b} {a1} {c} {a2}." for n in nouns for b in ['ist', 'sind']
+                     for a1 in adjectives for c in pool['connectors'] for a2 in adjectives],
+                    [f"{t} {v} {p} {n}." for t in ['Heute', 'Gestern', 'Morgen']
+                     for v in verbs for p in ['ich', 'wir', 'sie'] for n in nouns]
+                ])
+            return self._sentences[level]
+    
+    def _title_tables(self, level: str, topic: str):
+        with self._lock:
+            if (level, topic) not in self._titles:
+                pool = self.vocab.get(level, self.vocab['A1'])
+                self._titles[(level, topic)] = self._tables([
+                    [f"{d} {a.title()} {topic.title()}" for d in ['Die', 'Der', 'Das'] for a in pool['adjectives']],
+                    [f"{topic.title()} - {e} {n}" for e in ['Eine', 'Ein'] for n in pool['nouns']],
+                    [f"{v1.title()} und {v2.title()}: {topic}" for v1 in pool['verbs'] for v2 in pool['verbs']]
+                ])
+            return self._titles[(level, topic)]
+    
+    @staticmethod
+    def _pick(rng: np.random.Generator, tables, shape) -> List:
+        """Choose a template per slot, then a rendering within it - only chosen templates exist as text"""
+        table, offsets, sizes = tables
+        template = rng.integers(0, len(sizes), size=shape)
+        return table[offsets[template] + (rng.random(shape) * sizes[template]).astype(np.int64)].tolist()
+    
+    def readings(self, level: str, topic: str, count: int, seed: Optional[int] = None) -> List[str]:
+        """count reading texts in the per-call generator's format, reproducible from seed"""
+        
+        rng = np.random.default_rng(seed)
+        pool = self.vocab.get(level, self.vocab['A1'])
+        length = 8 if level in ['A1', 'A2'] else 12
+        
+        sentences = self._pick(rng, self._sentence_tables(level), (count, length))
+        titles = self._pick(rng, self._title_tables(level, topic), (count,))
+        
+        # Vocabulary list: noun, verb, adjective, noun, verb
+        word_lists = [np.array(pool[kind], dtype=object) for kind in ('nouns', 'verbs', 'adjectives', 'nouns', 'verbs')]
+        words = list(zip(*[
+            words[rng.integers(0, len(words), size=count)].tolist() for words in word_lists
+        ]))
+        
+        layout = PROCEDURAL_READING_LAYOUT.format
+        return [
+            layout(title, ' '.join(text), *vocabulary)
+            for title, text, vocabulary in zip(titles, sentences, words)
+        ]
+
+bulk_procedural = ProceduralBulkGenerator()
+
+# The five daily skills, and the section header that separates them in a daily bundle
+LESSON_SKILLS = ['reading', 'listening', 'writing', 'speaking', 'grammar']
+BUNDLE_MARKER = '=== {} ==='
+BUNDLE_HEADER = re.compile(r'^[ \t]*(?:={2,}|#{1,3}|\*\*)[ \t]*(READING|LISTENING|WRITING|SPEAKING|GRAMMAR)\b[^\n]*$',
+                           re.IGNORECASE | re.MULTILINE)
+
+# Prompt templates and level tables, built once at import. Indentation and blank
+# lines are stripped up front: the model doesn't need them, and they cost tokens.
+def compact_prompt(text: str) -> str:
+    """One instruction per line, no indentation, no blank lines"""
+    return '\n'.join(line.strip() for line in text.strip().splitlines() if line.strip())
+
+class PromptTemplate:
+    """A compacted str.format template with its fixed fields filled in, compiled to an f-string function
+    
+    render(**values) is that function itself: one call, one string build, no dict or parsing.
+    Values a template doesn't use are accepted and ignored.
+    """
+    
+    __slots__ = ('parts', 'fields', 'render')
+    
+    def __init__(self, template: str, **fixed):
+        parts = ['']
+        fields = []
+        for literal, field, _, _ in Formatter().parse(compact_prompt(template)):
+            parts[-1] += literal
+            if field is None:
+                continue
+            if field in fixed:
+                parts[-1] += str(fixed[field])
+            else:
+                fields.append(field)
+                parts.append('')
+        self.parts = tuple(parts)
+        self.fields = tuple(fields)
+        
+        # Literal parts are globals of the compiled function, so no text needs escaping
+        names = list(dict.fromkeys(fields))
+        body = ''.join(f"{{_p{i}}}{{{field}}}" for i, field in enumerate(fields)) + f"{{_p{len(fields)}}}"
+        params = f"*, {', '.join(names)}, **_" if names else '**_'
+        namespace = {f"_p{i}": part for i, part in enumerate(parts)}
+        exec(f"def render({params}):\n    return f'{body}'", namespace)
+        self.render = namespace['render']
+
+LEVEL_PARAMS = MappingProxyType({
+    level: MappingProxyType(params) for level, params in {
+        'A1': {
+            'vocabulary_range': '500-750 words',
+            'sentence_complexity': 'simple present, basic past',
+            'max_sentence_length': 10,
+            'topics': 'daily life, family, hobbies, food, basic activities',
+            'text_length': 150
+        },
+        'A2': {
+            'vocabulary_range': '1000-1500 words',
+            'sentence_complexity': 'present perfect, modal verbs, conjunctions',
+            'max_sentence_length': 15,
+            'topics': 'travel, work, health, shopping, past experiences',
+            'text_length': 150
+        },
+        'B1': {
+            'vocabulary_range': '2000-2500 words',
+            'sentence_complexity': 'subjunctive, relative clauses, passive voice',
+            'max_sentence_length': 20,
+            'topics': 'education, environment, culture, opinions, future plans',
+            'text_length': 250
+        },
+        'B2': {
+            'vocabulary_range': '3000-4000 words',
+            'sentence_complexity': 'all tenses, complex subordinate clauses',
+            'max_sentence_length': 25,
+            'topics': 'abstract concepts, current events, technology, society',
+            'text_length': 250
+        }
+    }.items()
+})
+
+# str.format sources; fields: level, topic, seed and the LEVEL_PARAMS keys
+PROMPT_SOURCES = MappingProxyType({
+    'reading': """
+        Generate a UNIQUE German reading text. Use seed {seed} for uniqueness.
+        
+        Requirements:
+        - Level: {level}
+        - Topic: {topic}
+        - Length: {text_length} words
+        - Vocabulary: {vocabulary_range}
+        - Sentence complexity: {sentence_complexity}
+        - Include variety in sentence structures
+        
+        Create a completely original text about {topic} that has never been written before.
+        Include cultural elements specific to German-speaking countries.
+        Make it engaging and educational.
+        
+        Format:
+        TITLE: [Creative title related to {topic}]
+        TEXT: [The main text]
+        VOCABULARY: [5 key words with English translations]
+        QUESTIONS: [3 comprehension questions]
+        CULTURAL_NOTE: [One interesting cultural fact related to the text]
+        """,
+    'listening': """
+        Create a UNIQUE German dialogue for listening practice. Seed: {seed}
+        
+        Requirements:
+        - Level: {level}
+        - Situation: {topic}
+        - Speakers: 2-3 people with distinct personalities
+        - Length: 8-12 exchanges
+        - Natural speech patterns, hesitations, and colloquialisms for {level}
+        
+        The dialogue should:
+        - Sound natural and realistic
+        - Include typical German expressions
+        - Have a clear beginning, middle, and end
+        - Include at least one cultural reference
+        
+        Format as a natural conversation with speaker names.
+        Add [AUDIO_CUE] markers for important sounds or emotions.
+        """,
+    'grammar': """
+        Design an innovative grammar exercise for {level} level focusing on {topic}.
+        Seed for uniqueness: {seed}
+        
+        Create exercises that:
+        - Test understanding, not just memorization
+        - Use real-world contexts
+        - Include {vocabulary_range} vocabulary
+        - Have varying difficulty within the {level} range
+        
+        Provide:
+        1. Brief explanation of the grammar point
+        2. 5 contextual exercises (not just fill-in-the-blank)
+        3. Real-world application task
+        4. Common mistakes to avoid
+        
+        Make it engaging and practical.
+        """,
+    'speaking': """
+        Create a unique speaking exercise for {level} level about {topic}.
+        Seed: {seed}
+        
+        Design:
+        - Scenario that requires {sentence_complexity}
+        - Role-play situation relevant to {topic}
+        - 5 progressive prompts from easy to challenging
+        - Pronunciation focus points
+        - Cultural communication tips
+        
+        Make it interactive and confidence-building.
+        """,
+    'writing': """
+        Generate a creative writing task for {level} level on {topic}.
+        Seed: {seed}
+        
+        Create:
+        - Engaging scenario requiring {text_length} words
+        - Clear purpose and audience
+        - Scaffolding prompts to guide writing
+        - Vocabulary suggestions from {vocabulary_range}
+        - Format requirements (email, blog, letter, etc.)
+        
+        Include evaluation criteria specific to {level}.
+        """,
+    'daily_bundle': """
+        Create today's complete German lesson set for {level} level on the topic {topic}.
+        Seed for uniqueness: {seed}
+        
+        For every part:
+        - Vocabulary: {vocabulary_range}
+        - Sentence complexity: {sentence_complexity}
+        - Keep everything unique, engaging and culturally authentic
+        
+        Write each part under its header line exactly as shown, in this order:
+        {sections}
+        """,
+    'tutor_response': """
+        You are a patient, encouraging German tutor. Seed: {seed}
+        {context}
+        Reply to the latest message in German suited to {level}, with a short English
+        explanation where it helps. Gently correct any mistakes the learner made.
+        """,
+    'generic': """
+        Generate educational German content for {level} level about {topic}.
+        Make it unique using seed {seed}.
+        Content should be appropriate for {topics}.
+        Use vocabulary from {vocabulary_range}.
+        Apply {sentence_complexity}.
+        """
+})
+
+# Daily-bundle parts, joined in the requested skill order (fields: topic, LEVEL_PARAMS keys)
+BUNDLE_SECTION_SOURCES = MappingProxyType({
+    'reading': """
+        A reading text of {text_length} words, in this format:
+        TITLE: [Creative title related to {topic}]
+        TEXT: [The main text]
+        VOCABULARY: [5 key words with English translations]
+        QUESTIONS: [3 comprehension questions]
+        CULTURAL_NOTE: [One interesting cultural fact related to the text]
+        """,
+    'listening': """
+        A natural dialogue of 8-12 exchanges between 2-3 named speakers, with
+        [AUDIO_CUE] markers for important sounds or emotions.
+        """,
+    'writing': """
+        A writing task: scenario, purpose and audience, scaffolding prompts,
+        vocabulary suggestions, format requirements and evaluation criteria.
+        """,
+    'speaking': """
+        A role-play scenario with 5 progressive prompts, pronunciation focus
+        points and cultural communication tips.
+        """,
+    'grammar': """
+        A brief explanation of one grammar point, 5 contextual exercises,
+        a real-world application task and common mistakes to avoid.
+        """
+})
+
+# Compiled once per (name, level), so a call only fills in level, topic and seed
+PROMPT_TEMPLATES = MappingProxyType({
+    (name, level): PromptTemplate(source, **params)
+    for name, source in PROMPT_SOURCES.items()
+    for level, params in LEVEL_PARAMS.items()
+})
+BUNDLE_SECTION_PROMPTS = MappingProxyType({
+    (skill, level): PromptTemplate(BUNDLE_MARKER.format(skill.upper()) + source, **params)
+    for skill, source in BUNDLE_SECTION_SOURCES.items()
+    for level, params in LEVEL_PARAMS.items()
+})
+
+def _renderers(templates: Mapping) -> Dict[str, Dict[str, Callable[..., str]]]:
+    """Hot-path view of a template table: name -> level -> bound render, plain dicts"""
+    table = {}
+    for (name, level), template in templates.items():
+        table.setdefault(name, {})[level] = template.render
+    return table
+
+PROMPT_RENDERERS = _renderers(PROMPT_TEMPLATES)
+BUNDLE_SECTION_RENDERERS = _renderers(BUNDLE_SECTION_PROMPTS)
 
 class AIContentEngine:
     """True AI content generation engine - NO PREDEFINED CONTENT"""
     
-    def __init__(self):
+    def __init__(self, dispatch_mode: str = DEFAULT_DISPATCH_MODE, hedge_delay: Optional[float] = None,
+                 cache_enabled: Optional[bool] = None, fanout_variants: bool = False,
+                 timeout: float = DEFAULT_GENERATION_TIMEOUT, procedural_fallback: bool = True,
+                 structured: Optional[bool] = None):
         self.setup_providers()
-        self.content_cache = {}  # Cache for efficiency, not predefined content
+        self.content_cache = generation_cache  # Cache for efficiency, not predefined content
+        if cache_enabled is None:
+            cache_enabled = st.session_state.get('generation_cache', False)
+        self.cache_enabled = cache_enabled
+        self.fanout_variants = fanout_variants  # Coalesced waiters prefer another cached variant
+        self.dispatch_mode = dispatch_mode
+        self.hedge_delay = hedge_delay  # None = use the leading provider's observed p95
+        self.timeout = timeout  # Seconds per generate call, procedural reserve included
+        self.procedural_fallback = procedural_fallback  # False = '' when no AI answers (offline builds)
+        if structured is None:
+            structured = st.session_state.get('structured_output', True)
+        self.structured = structured  # JSON-schema answers plus a repair call for missing fields
+        self.structured_stats = {'lessons': 0, 'valid': 0, 'repaired': 0, 'incomplete': 0, 'repair_calls': 0}
         
     def setup_providers(self):
         """Setup AI providers from session state"""
@@ -30,7 +1727,8 @@ class AIContentEngine:
                     'meta-llama/llama-3.2-3b-instruct:free',
                     'google/gemma-7b-it:free',
                     'mistralai/mistral-7b-instruct:free'
-                ]
+                ],
+                'economy_model': 'meta-llama/llama-3.2-3b-instruct:free'
             },
             'huggingface': {
                 'key': st.session_state.get('api_keys', {}).get('huggingface', ''),
@@ -39,241 +1737,586 @@ class AIContentEngine:
                     'mistralai/Mistral-7B-Instruct-v0.2',
                     'google/flan-t5-xxl',
                     'facebook/blenderbot-400M-distill'
-                ]
+                ],
+                'economy_model': 'mistralai/Mistral-7B-Instruct-v0.2'
             },
             'together': {
                 'key': st.session_state.get('api_keys', {}).get('together', ''),
                 'url': 'https://api.together.xyz/v1/chat/completions',
-                'models': ['meta-llama/Llama-2-7b-chat-hf']
+                'models': ['meta-llama/Llama-2-7b-chat-hf'],
+                'economy_model': 'meta-llama/Llama-2-7b-chat-hf'
             }
         }
+        
+        # Offline runs: every provider talks to the stand-in server or the fixture store
+        if PROVIDER_BASE_URL or async_http.mode == 'replay':
+            for config in self.providers.values():
+                config['key'] = config['key'] or OFFLINE_API_KEY
+                if PROVIDER_BASE_URL:
+                    config['url'] = rebase_url(config['url'], PROVIDER_BASE_URL)
+    
+    def generate_unique_content(self, content_type: str, level: str, topic: str, context: Dict = None,
+                                timeout: Optional[float] = None, user: Optional[str] = None) -> str:
+        """Generate truly unique content using AI - no fallbacks (pass user off the script thread)"""
+        deadline = self._ai_deadline(timeout)
+        return engine_loop.run(
+            self.agenerate_unique_content(content_type, level, topic, context, user or self._user_id(), deadline)
+        )
+    
+    def generate_unique_content_stream(self, content_type: str, level: str, topic: str,
+                                       context: Dict = None, timeout: Optional[float] = None) -> Iterator[str]:
+        """Like generate_unique_content, but yields text chunks as the provider streams them"""
+        deadline = self._ai_deadline(timeout)
+        return engine_loop.iterate(
+            self.agenerate_unique_content_stream(content_type, level, topic, context, self._user_id(), deadline)
+        )
     
-    def generate_unique_content(self, content_type: str, level: str, topic: str, context: Dict = None) -> str:
-        """Generate truly unique content using AI - no fallbacks"""
+    def generate_many(self, requests_list: List[Tuple], timeout: Optional[float] = None,
+                      user: Optional[str] = None) -> List[str]:
+        """Run several (content_type, level, topic[, context]) generations concurrently on the engine loop"""
         
-        # Create a unique seed for this content request
-        unique_seed = hashlib.md5(f"{content_type}{level}{topic}{datetime.now().isoformat()}".encode()).hexdigest()
+        user = user or self._user_id()
+        deadline = self._ai_deadline(timeout)
+        
+        async def run_all():
+            # One shared budget: the batch is as slow as its slowest member
+            return await asyncio.gather(*[
+                self.agenerate_unique_content(*request, user=user, deadline=deadline) for request in requests_list
+            ])
+        
+        return engine_loop.run(run_all())
+    
+    async def agenerate_unique_content(self, content_type: str, level: str, topic: str,
+                                       context: Dict = None, user: str = 'guest',
+                                       deadline: Optional[float] = None) -> str:
+        """Async core of generate_unique_content; runs on the engine loop (deadline is absolute time)"""
+        
+        # Absolute time by which AI attempts must finish, leaving the procedural reserve
+        ai_deadline = self._ai_deadline(None) if deadline is None else deadline
+        
+        plan = self._plan_request(content_type, level, topic, context)
+        if plan['cached']:
+            return plan['cached']
+        
+        # No provider can be reached: go straight to procedural text, nothing to charge
+        if not self._candidates():
+            return self._procedural_generation(content_type, level, topic, plan['seed']) if self.procedural_fallback else ''
         
         # Build the prompt based on content type
-        prompt = self._build_dynamic_prompt(content_type, level, topic, unique_seed, context)
+        if self.structured and content_type in LESSON_SCHEMAS:
+            prompt = self._build_structured_prompt(content_type, level, topic, plan['seed'])
+            call = lambda: self._structured_dispatch(content_type, level, topic, prompt, ai_deadline)
+        else:
+            prompt = self._build_dynamic_prompt(content_type, level, topic, plan['seed'], context)
+            call = lambda: self._dispatch(prompt, ai_deadline)
         
-        # Try multiple AI providers
-        response = None
+        # The learner is charged only when this request is the one calling upstream:
+        # cache hits, fan-out shortcuts and coalesced followers never reach admit_user
+        refused = False
         
-        # Try OpenRouter first
-        if self.providers['openrouter']['key']:
-            response = self._call_openrouter(prompt)
+        async def dispatch():
+            nonlocal refused
+            if not await request_governor.admit_user(user, max_wait=time_left(ai_deadline)):
+                refused = True
+                return None
+            return await call()
         
-        # Try HuggingFace if OpenRouter fails
-        if not response and self.providers['huggingface']['key']:
-            response = self._call_huggingface(prompt)
+        # Try the configured AI providers, sharing one call between identical concurrent requests
+        shared = False
+        try:
+            if plan['flight_key']:
+                response, shared = await asyncio.wait_for(
+                    inflight_requests.do(
+                        plan['flight_key'],
+                        dispatch,
+                        lambda: self._other_cached_variant(plan['cache_key'], plan['slot'])
+                    ),
+                    time_left(ai_deadline)
+                )
+            else:
+                response = await asyncio.wait_for(dispatch(), time_left(ai_deadline))
+        except asyncio.TimeoutError:
+            response = None
+
+        # The leader gave up (its own deadline or providers); a follower may still have time to try
+        if shared and not response and time_left(ai_deadline) >= MIN_ATTEMPT_TIME:
+            shared = False
+            try:
+                response = await asyncio.wait_for(dispatch(), time_left(ai_deadline))
+            except asyncio.TimeoutError:
+                response = None
         
-        # Try Together AI
-        if not response and self.providers['together']['key']:
-            response = self._call_together(prompt)
+        # Over the learner's rate or daily budget: degrade instead of calling out
+        if refused:
+            return self._degraded_response(plan, content_type, level, topic)
+
+        # Only AI output is cached, and only by whoever generated it: a shared or
+        # shortcut result already lives in its own slot and must not fill this one
+        if response and plan['cache_key'] and not shared:
+            state_writer.submit(self.content_cache.put, plan['cache_key'], plan['slot'], response)
         
         # If no AI available, use advanced procedural generation
-        if not response:
-            response = self._procedural_generation(content_type, level, topic, unique_seed)
+        if not response and self.procedural_fallback:
+            response = self._procedural_generation(content_type, level, topic, plan['seed'])
         
-        return response
+        return response or ''
     
-    def _build_dynamic_prompt(self, content_type: str, level: str, topic: str, seed: str, context: Dict) -> str:
-        """Build dynamic prompts for AI generation"""
+    async def agenerate_unique_content_stream(self, content_type: str, level: str, topic: str,
+                                              context: Dict = None, user: str = 'guest',
+                                              deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Async core of generate_unique_content_stream (the absolute deadline bounds time to first chunk)"""
         
-        # Level-specific parameters
-        level_params = {
-            'A1': {
-                'vocabulary_range': '500-750 words',
-                'sentence_complexity': 'simple present, basic past',
-                'max_sentence_length': 10,
-                'topics': 'daily life, family, hobbies, food, basic activities'
-            },
-            'A2': {
-                'vocabulary_range': '1000-1500 words',
-                'sentence_complexity': 'present perfect, modal verbs, conjunctions',
-                'max_sentence_length': 15,
-                'topics': 'travel, work, health, shopping, past experiences'
-            },
-            'B1': {
-                'vocabulary_range': '2000-2500 words',
-                'sentence_complexity': 'subjunctive, relative clauses, passive voice',
-                'max_sentence_length': 20,
-                'topics': 'education, environment, culture, opinions, future plans'
-            },
-            'B2': {
-                'vocabulary_range': '3000-4000 words',
-                'sentence_complexity': 'all tenses, complex subordinate clauses',
-                'max_sentence_length': 25,
-                'topics': 'abstract concepts, current events, technology, society'
-            }
-        }
+        ai_deadline = self._ai_deadline(None) if deadline is None else deadline
         
-        params = level_params.get(level, level_params['A1'])
+        plan = self._plan_request(content_type, level, topic, context)
+        if plan['cached']:
+            yield plan['cached']
+            return
         
-        if content_type == 'reading':
-            return f"""
-            Generate a UNIQUE German reading text. Use seed {seed} for uniqueness.
-            
-            Requirements:
-            - Level: {level}
-            - Topic: {topic}
-            - Length: {150 if level in ['A1', 'A2'] else 250} words
-            - Vocabulary: {params['vocabulary_range']}
-            - Sentence complexity: {params['sentence_complexity']}
-            - Include variety in sentence structures
-            
-            Create a completely original text about {topic} that has never been written before.
-            Include cultural elements specific to German-speaking countries.
-            Make it engaging and educational.
-            
-            Format:
-            TITLE: [Creative title related to {topic}]
-            TEXT: [The main text]
-            VOCABULARY: [5 key words with English translations]
-            QUESTIONS: [3 comprehension questions]
-            CULTURAL_NOTE: [One interesting cultural fact related to the text]
-            """
+        # Only a request that will call upstream is charged to the learner
+        candidates = self._candidates()
+        if candidates and not await request_governor.admit_user(user, max_wait=time_left(ai_deadline)):
+            yield self._degraded_response(plan, content_type, level, topic)
+            return
         
-        elif content_type == 'listening':
-            return f"""
-            Create a UNIQUE German dialogue for listening practice. Seed: {seed}
-            
-            Requirements:
-            - Level: {level}
-            - Situation: {topic}
-            - Speakers: 2-3 people with distinct personalities
-            - Length: 8-12 exchanges
-            - Natural speech patterns, hesitations, and colloquialisms for {level}
-            
-            The dialogue should:
-            - Sound natural and realistic
-            - Include typical German expressions
-            - Have a clear beginning, middle, and end
-            - Include at least one cultural reference
-            
-            Format as a natural conversation with speaker names.
-            Add [AUDIO_CUE] markers for important sounds or emotions.
-            """
+        prompt = self._build_dynamic_prompt(content_type, level, topic, plan['seed'], context)
         
-        elif content_type == 'grammar':
-            return f"""
-            Design an innovative grammar exercise for {level} level focusing on {topic}.
-            Seed for uniqueness: {seed}
+        for name in candidates:
+            chunks = []
+            complete = True
             
-            Create exercises that:
-            - Test understanding, not just memorization
-            - Use real-world contexts
-            - Include {params['vocabulary_range']} vocabulary
-            - Have varying difficulty within the {level} range
+            if time_left(ai_deadline) < MIN_ATTEMPT_TIME:
+                break
             
-            Provide:
-            1. Brief explanation of the grammar point
-            2. 5 contextual exercises (not just fill-in-the-blank)
-            3. Real-world application task
-            4. Common mistakes to avoid
+            if name in STREAMING_PROVIDERS:
+                try:
+                    async for chunk in self._stream_chat(name, prompt, ai_deadline):
+                        chunks.append(chunk)
+                        yield chunk
+                except Exception:
+                    # Broke off after chunks were shown: keep them on screen, but never cache them
+                    complete = False
+            else:
+                # No token streaming on this endpoint: deliver the whole answer as one chunk
+                response = await self._call_provider(name, prompt, ai_deadline)
+                if response:
+                    chunks.append(response)
+                    yield response
             
-            Make it engaging and practical.
-            """
+            if chunks:
+                # Structured mode: fill in the sections the free-text answer left out
+                if complete and self.structured and content_type in LESSON_SCHEMAS:
+                    extra = await self._repaired_sections(
+                        content_type, level, topic, ''.join(chunks), self._ai_deadline(None)
+                    )
+                    if extra:
+                        chunks.append(extra)
+                        yield extra
+                if plan['cache_key'] and complete:
+                    state_writer.submit(self.content_cache.put, plan['cache_key'], plan['slot'], ''.join(chunks))
+                return
         
-        elif content_type == 'speaking':
-            return f"""
-            Create a unique speaking exercise for {level} level about {topic}.
-            Seed: {seed}
-            
-            Design:
-            - Scenario that requires {params['sentence_complexity']}
-            - Role-play situation relevant to {topic}
-            - 5 progressive prompts from easy to challenging
-            - Pronunciation focus points
-            - Cultural communication tips
-            
-            Make it interactive and confidence-building.
-            """
+        if self.procedural_fallback:
+            yield self._procedural_generation(content_type, level, topic, plan['seed'])
+    
+    def _ai_deadline(self, timeout: Optional[float]) -> float:
+        """Absolute deadline for AI attempts: the request budget in seconds minus the procedural reserve"""
+        budget = self.timeout if timeout is None else timeout
+        return time.time() + max(budget - PROCEDURAL_RESERVE, 0.0)
+    
+    def _user_id(self) -> str:
+        """Learner the request is charged to (read on the script thread, where session state lives)"""
+        return st.session_state.get('user_name') or 'guest'
+    
+    def _degraded_response(self, plan: Dict, content_type: str, level: str, topic: str) -> str:
+        """Any stored variant of this request, else procedural content - never nothing"""
         
-        elif content_type == 'writing':
-            return f"""
-            Generate a creative writing task for {level} level on {topic}.
-            Seed: {seed}
+        if plan['flight_key']:
+            for slot in range(self.content_cache.variants):
+                text = self.content_cache.get(plan['flight_key'], slot)
+                if text:
+                    return text
+        
+        if not self.procedural_fallback:
+            return ''
+        return self._procedural_generation(content_type, level, topic, plan['seed'])
+    
+    def _plan_request(self, content_type: str, level: str, topic: str, context: Dict) -> Dict:
+        """Work out request key, cache slot and seed; includes the cached text on a hit"""
+        
+        plan = {'flight_key': None, 'cache_key': None, 'slot': 0, 'cached': None}
+        if is_cacheable(content_type):
+            plan['flight_key'] = GenerationCache.make_key(content_type, level, topic, context)
+        
+        if self.cache_enabled and plan['flight_key']:
+            # Serve the next rotating variant when it is already cached
+            plan['cache_key'] = plan['flight_key']
+            plan['slot'] = self.content_cache.next_slot(plan['cache_key'])
+            plan['cached'] = self.content_cache.get(plan['cache_key'], plan['slot'])
+            plan['seed'] = hashlib.md5(f"{plan['cache_key']}{plan['slot']}".encode()).hexdigest()
+        else:
+            # Create a unique seed for this content request
+            plan['seed'] = hashlib.md5(f"{content_type}{level}{topic}{datetime.now().isoformat()}".encode()).hexdigest()
+        
+        return plan
+    
+    def _other_cached_variant(self, cache_key: Optional[str], slot: int) -> Optional[str]:
+        """With fan-out on, a coalesced request takes a different cached variant instead of waiting"""
+        
+        if not (self.fanout_variants and cache_key):
+            return None
+        
+        for other_slot in range(self.content_cache.variants):
+            if other_slot != slot:
+                text = self.content_cache.get(cache_key, other_slot)
+                if text:
+                    return text
+        
+        return None
+    
+    def _candidates(self) -> List[str]:
+        """Configured providers with at least one usable model, best score first"""
+        return provider_scorer.rank_providers({
+            name: self.providers[name]['models']
+            for name in PROVIDER_ORDER
+            if self.providers[name]['key'] and circuit_breakers.any_available(name, self.providers[name]['models'])
+        })
+    
+    async def _dispatch(self, prompt: str, deadline: float, schema: Optional[Dict] = None) -> Optional[str]:
+        """Send the prompt to the configured providers, fastest first, until the deadline"""
+        
+        candidates = self._candidates()
+        
+        if self.dispatch_mode == 'hedged' and len(candidates) > 1:
+            return await self._hedged_dispatch(prompt, candidates, deadline, schema)
+        
+        for name in candidates:
+            if time_left(deadline) < MIN_ATTEMPT_TIME:
+                break
+            response = await self._call_provider(name, prompt, deadline, schema)
+            if response:
+                return response
+        
+        return None
+    
+    async def _hedged_dispatch(self, prompt: str, candidates: List[str], deadline: float,
+                               schema: Optional[Dict] = None) -> Optional[str]:
+        """Race providers: start the next one whenever the leader exceeds the hedge delay or fails"""
+        
+        remaining = list(candidates)
+        running = set()
+        
+        def launch():
+            name = remaining.pop(0)
+            running.add(asyncio.ensure_future(self._call_provider(name, prompt, deadline, schema)))
+            delay = self.hedge_delay
+            if delay is None:
+                delay = provider_scorer.p95(name, DEFAULT_HEDGE_DELAY)
+            return time.time() + delay
+        
+        hedge_at = launch()
+        
+        try:
+            while running:
+                timeout = max(hedge_at - time.time(), 0) if remaining else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    running.discard(task)
+                    response = task.result()
+                    if response:
+                        return response
+                
+                # Hedge when the leader is too slow, or nothing is left in flight, while time remains
+                if time_left(deadline) < MIN_ATTEMPT_TIME:
+                    remaining.clear()
+                if remaining and (not done or not running):
+                    hedge_at = launch()
+        finally:
+            # Losing requests are cancelled mid-flight, closing their connections
+            for task in running:
+                task.cancel()
+        
+        return None
+    
+    async def _call_provider(self, name: str, prompt: str, deadline: float,
+                             schema: Optional[Dict] = None) -> Optional[str]:
+        """Call one provider adapter and record its latency on success"""
+        
+        adapters = {
+            'openrouter': self._call_chat,
+            'huggingface': self._call_huggingface,
+            'together': self._call_chat
+        }
+        
+        start = time.time()
+        try:
+            response = await adapters[name](name, prompt, deadline, schema)
+        except Exception:
+            return None
+        
+        if response:
+            provider_scorer.record_call(name, time.time() - start)
+        
+        return response
+    
+    def _record_attempt(self, provider: str, model: str, started: float, content: Optional[str]) -> Optional[str]:
+        """Score a finished model attempt and pass through usable content"""
+        
+        if content and content.strip():
+            provider_scorer.record(provider, model, time.time() - started, 'ok')
+            circuit_breakers.get(provider, model).record_success()
+            return content
+        
+        provider_scorer.record(provider, model, time.time() - started, 'empty')
+        circuit_breakers.get(provider, model).record_failure()
+        return None
+    
+    def _record_failure(self, provider: str, model: str, started: float):
+        """Score a failed model attempt (HTTP error, timeout, bad payload)"""
+        provider_scorer.record(provider, model, time.time() - started, 'error')
+        circuit_breakers.get(provider, model).record_failure()
+    
+    def _build_dynamic_prompt(self, content_type: str, level: str, topic: str, seed: str, context: Dict) -> str:
+        """Build dynamic prompts for AI generation"""
+        
+        renderers = PROMPT_RENDERERS.get(content_type) or PROMPT_RENDERERS['generic']
+        render = renderers.get(level) or renderers['A1']
+        
+        if content_type == 'daily_bundle':
+            skills = (context or {}).get('skills') or LESSON_SKILLS
+            sections = '\n'.join(
+                (BUNDLE_SECTION_RENDERERS[skill].get(level) or BUNDLE_SECTION_RENDERERS[skill]['A1'])(topic=topic)
+                for skill in skills
+            )
+            return render(level=level, topic=topic, seed=seed, sections=sections)
+        
+        if content_type == 'tutor_response':
+            context = context or {}
+            packed = build_tutor_context(context, context.get('token_budget', TUTOR_CONTEXT_TOKENS))
+            return render(level=level, seed=seed, context=packed)
+        
+        return render(level=level, topic=topic, seed=seed)
+    
+    def _build_structured_prompt(self, content_type: str, level: str, topic: str, seed: str) -> str:
+        """The content type's prompt asking for a JSON object matching LESSON_SCHEMAS"""
+        renderers = STRUCTURED_RENDERERS[content_type]
+        return (renderers.get(level) or renderers['A1'])(level=level, topic=topic, seed=seed)
+    
+    async def _structured_dispatch(self, content_type: str, level: str, topic: str, prompt: str,
+                                   deadline: float) -> Optional[str]:
+        """JSON-mode dispatch: validate the answer, re-ask only for missing fields, return section text"""
+        
+        response = await self._dispatch(prompt, deadline, LESSON_SCHEMAS[content_type])
+        if not response:
+            return None
+        
+        # A model that ignored JSON mode may still have answered in the line format
+        data = extract_json(response)
+        if data is None:
+            data = LESSON_PARSERS[content_type].parse(response)
+        lesson, _ = await self._complete_lesson(content_type, level, topic, data, deadline)
+        return render_sections(content_type, lesson)
+    
+    async def _complete_lesson(self, content_type: str, level: str, topic: str, data: Dict,
+                               deadline: float) -> Tuple[Dict, List[str]]:
+        """Validate a parsed answer and re-ask only for missing fields; returns the lesson and the fields repaired"""
+        
+        lesson, missing = validate_lesson(content_type, data)
+        
+        stats = self.structured_stats
+        stats['lessons'] += 1
+        filled = []
+        # The repair gets its own, earlier deadline: running out of time keeps the partial
+        # lesson instead of losing it to the caller's timeout
+        repair_deadline = deadline - REPAIR_MARGIN
+        if missing and time_left(repair_deadline) >= MIN_ATTEMPT_TIME:
+            stats['repair_calls'] += 1
+            repair = REPAIR_PROMPT.render(
+                level=level, content_type=content_type, topic=topic, missing=', '.join(missing),
+                lesson=json.dumps({name: value for name, value in lesson.items() if value}, ensure_ascii=False),
+                schema=schema_text(repair_schema(content_type, missing))
+            )
+            try:
+                answer = await asyncio.wait_for(
+                    self._dispatch(repair, repair_deadline, repair_schema(content_type, missing)),
+                    time_left(repair_deadline)
+                )
+            except asyncio.TimeoutError:
+                answer = None
+            patch = extract_json(answer) or {}
+            asked = missing
+            lesson, missing = validate_lesson(content_type, {**lesson, **{name: patch.get(name) for name in asked}})
+            filled = [name for name in asked if name not in missing]
+            if not missing:
+                stats['repaired'] += 1
+        elif not missing:
+            stats['valid'] += 1
+        if missing:
+            stats['incomplete'] += 1
+        
+        return lesson, filled
+    
+    async def _repaired_sections(self, content_type: str, level: str, topic: str, text: str,
+                                 deadline: float) -> str:
+        """Structured mode for free text: section text for the fields the answer lacked ('' if none)"""
+        
+        lesson, filled = await self._complete_lesson(
+            content_type, level, topic, LESSON_PARSERS[content_type].parse(text), deadline
+        )
+        if not filled:
+            return ''
+        return '\n' + render_sections(content_type, {name: lesson[name] for name in filled})
+    
+    def complete_lessons(self, level: str, topic: str, texts: Dict[str, str]) -> Dict[str, str]:
+        """Structured mode: check free-text lessons (e.g. bundle sections) and append repaired sections"""
+        
+        wanted = [skill for skill, text in texts.items() if text and skill in LESSON_SCHEMAS]
+        if not (self.structured and wanted):
+            return texts
+        
+        async def repair_all():
+            deadline = self._ai_deadline(None)
+            return await asyncio.gather(*[
+                self._repaired_sections(skill, level, topic, texts[skill], deadline) for skill in wanted
+            ])
+        
+        completed = dict(texts)
+        for skill, extra in zip(wanted, engine_loop.run(repair_all())):
+            completed[skill] += extra
+        return completed
+    
+    def _models_to_try(self, provider: str) -> List[str]:
+        """Models in score order, skipping open breakers; only the economy model when the budget runs low"""
+        
+        config = self.providers[provider]
+        models = provider_scorer.rank_models(provider, config['models'])
+        if request_governor.economy(provider, config['key']) and config.get('economy_model'):
+            models = [config['economy_model']]
+        
+        return [model for model in models if circuit_breakers.get(provider, model).available()]
+    
+    def _chat_request(self, provider: str, model: str, prompt: str,
+                      schema: Optional[Dict] = None) -> Tuple[Dict, Dict]:
+        """Headers and body for an OpenAI-compatible chat completion (OpenRouter, Together)"""
+        
+        key = self.providers[provider]['key']
+        
+        if provider == 'openrouter':
+            headers = {
+                "Authorization": f"Bearer {key}",
+                "HTTP-Referer": "https://linguaflow.streamlit.app",
+                "X-Title": "LinguaFlow",
+                "Content-Type": "application/json"
+            }
             
-            Create:
-            - Engaging scenario requiring {150 if level in ['A1', 'A2'] else 250} words
-            - Clear purpose and audience
-            - Scaffolding prompts to guide writing
-            - Vocabulary suggestions from {params['vocabulary_range']}
-            - Format requirements (email, blog, letter, etc.)
+            data = {
+                "model": model,
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": "You are an expert German language educator creating unique, pedagogically sound content."
+                    },
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ],
+                "temperature": 0.9,  # Higher for more creativity
+                "max_tokens": 2000,
+                "top_p": 0.95,
+                "frequency_penalty": 0.5,  # Reduce repetition
+                "presence_penalty": 0.5    # Encourage novelty
+            }
+        else:
+            headers = {
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json"
+            }
             
-            Include evaluation criteria specific to {level}.
-            """
+            data = {
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": "You are a German language expert."},
+                    {"role": "user", "content": prompt}
+                ],
+                "temperature": 0.9,
+                "max_tokens": 1500
+            }
         
-        else:
-            return f"""
-            Generate educational German content for {level} level about {topic}.
-            Make it unique using seed {seed}.
-            Content should be appropriate for {params['topics']}.
-            Use vocabulary from {params['vocabulary_range']}.
-            Apply {params['sentence_complexity']}.
-            """
-    
-    def _call_openrouter(self, prompt: str) -> Optional[str]:
-        """Call OpenRouter API with fallback models"""
-        
-        key = self.providers['openrouter']['key']
+        # JSON mode in each endpoint's dialect; the prompt carries the schema for models that ignore it
+        if schema is not None:
+            if provider == 'openrouter':
+                data["response_format"] = {
+                    "type": "json_schema",
+                    "json_schema": {"name": "lesson", "strict": True, "schema": schema}
+                }
+            else:
+                data["response_format"] = {"type": "json_object", "schema": schema}
+        
+        return headers, data
+    
+    async def _call_chat(self, provider: str, prompt: str, deadline: float,
+                         schema: Optional[Dict] = None) -> Optional[str]:
+        """Call an OpenAI-compatible chat endpoint (OpenRouter, Together) with fallback models"""
+        
+        key = self.providers[provider]['key']
         if not key:
             return None
         
-        for model in self.providers['openrouter']['models']:
+        for model in self._models_to_try(provider):
+            # Each attempt only gets the time left in the request budget
+            if time_left(deadline) < MIN_ATTEMPT_TIME:
+                break
+            
+            # Skip endpoints whose breaker is open instead of waiting out their timeout
+            breaker = circuit_breakers.get(provider, model)
+            if not breaker.allow():
+                continue
+            
+            # Over this key's rate limit or daily budget: leave it to the next provider.
+            # Charged only now, so calls a breaker turned away never spend the budget
+            if not await request_governor.acquire_provider(provider, key, max_wait=time_left(deadline)):
+                breaker.release()
+                break
+            
+            started = time.time()
             try:
-                headers = {
-                    "Authorization": f"Bearer {key}",
-                    "HTTP-Referer": "https://linguaflow.streamlit.app",
-                    "X-Title": "LinguaFlow",
-                    "Content-Type": "application/json"
-                }
-                
-                data = {
-                    "model": model,
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": "You are an expert German language educator creating unique, pedagogically sound content."
-                        },
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "temperature": 0.9,  # Higher for more creativity
-                    "max_tokens": 2000,
-                    "top_p": 0.95,
-                    "frequency_penalty": 0.5,  # Reduce repetition
-                    "presence_penalty": 0.5    # Encourage novelty
-                }
-                
-                response = requests.post(
-                    self.providers['openrouter']['url'],
-                    headers=headers,
-                    json=data,
-                    timeout=20
+                headers, data = self._chat_request(provider, model, prompt, schema)
+                result = await async_http.post_json(
+                    self.providers[provider]['url'], headers, data, timeout=attempt_timeout(deadline)
                 )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result['choices'][0]['message']['content']
+                content = self._record_attempt(provider, model, started, result['choices'][0]['message']['content'])
+                if content:
+                    return content
                     
-            except Exception as e:
+            except Exception:
+                self._record_failure(provider, model, started)
                 continue
         
         return None
     
-    def _call_huggingface(self, prompt: str) -> Optional[str]:
-        """Call HuggingFace API with multiple models"""
+    async def _call_huggingface(self, provider: str, prompt: str, deadline: float,
+                                schema: Optional[Dict] = None) -> Optional[str]:
+        """Call HuggingFace API with multiple models (no JSON mode: the schema travels in the prompt)"""
         
         key = self.providers['huggingface']['key']
         if not key:
             return None
         
-        for model in self.providers['huggingface']['models']:
+        for model in self._models_to_try('huggingface'):
+            if time_left(deadline) < MIN_ATTEMPT_TIME:
+                break
+            
+            breaker = circuit_breakers.get('huggingface', model)
+            if not breaker.allow():
+                continue
+            
+            if not await request_governor.acquire_provider('huggingface', key, max_wait=time_left(deadline)):
+                breaker.release()
+                break
+            
+            started = time.time()
             try:
                 headers = {
                     "Authorization": f"Bearer {key}",
@@ -292,141 +2335,129 @@ class AIContentEngine:
                     "inputs": formatted_prompt,
                     "parameters": {
                         "max_new_tokens": 1500,
-                        "temperature": 0.9,
-                        "top_p": 0.95,
-                        "do_sample": True,
-                        "return_full_text": False
-                    }
-                }
-                
-                response = requests.post(
-                    f"{self.providers['huggingface']['url']}{model}",
-                    headers=headers,
-                    json=data,
-                    timeout=20
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    if isinstance(result, list):
-                        return result[0].get('generated_text', '')
-                    return result.get('generated_text', '')
-                    
-            except Exception as e:
-                continue
-        
-        return None
-    
-    def _call_together(self, prompt: str) -> Optional[str]:
-        """Call Together AI API"""
-        
-        key = self.providers['together']['key']
-        if not key:
-            return None
-        
-        try:
-            headers = {
-                "Authorization": f"Bearer {key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": self.providers['together']['models'][0],
-                "messages": [
-                    {"role": "system", "content": "You are a German language expert."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.9,
-                "max_tokens": 1500
-            }
-            
-            response = requests.post(
-                self.providers['together']['url'],
-                headers=headers,
-                json=data,
-                timeout=20
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
+                        "temperature": 0.9,
+                        "top_p": 0.95,
+                        "do_sample": True,
+                        "return_full_text": False
+                    }
+                }
                 
-        except Exception:
-            pass
+                result = await async_http.post_json(
+                    f"{self.providers['huggingface']['url']}{model}", headers, data, timeout=attempt_timeout(deadline)
+                )
+                if isinstance(result, list):
+                    result = result[0]
+                content = self._record_attempt('huggingface', model, started, result.get('generated_text', ''))
+                if content:
+                    return content
+                    
+            except Exception:
+                self._record_failure('huggingface', model, started)
+                continue
         
         return None
     
+    async def _stream_chat(self, provider: str, prompt: str, deadline: float) -> AsyncIterator[str]:
+        """Stream an OpenAI-compatible chat completion over SSE, falling through models until one answers
+        
+        Ends quietly only after [DONE] or a clean EOF; a stream that breaks after yielding
+        chunks re-raises, so the caller knows the text is partial.
+        """
+        
+        for model in self._models_to_try(provider):
+            if time_left(deadline) < MIN_ATTEMPT_TIME:
+                return
+            breaker = circuit_breakers.get(provider, model)
+            if not breaker.allow():
+                continue
+            if not await request_governor.acquire_provider(provider, self.providers[provider]['key'],
+                                                           max_wait=time_left(deadline)):
+                breaker.release()
+                return
+            
+            started = time.time()
+            produced = False
+            try:
+                headers, data = self._chat_request(provider, model, prompt)
+                data['stream'] = True
+                
+                async for line in async_http.stream_lines(
+                    self.providers[provider]['url'], headers, data, timeout=attempt_timeout(deadline)
+                ):
+                    # SSE: 'data: {json}' events, comments start with ':'
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == '[DONE]':
+                        break
+                    
+                    choices = json.loads(payload).get('choices') or [{}]
+                    chunk = (choices[0].get('delta') or {}).get('content')
+                    if chunk:
+                        produced = True
+                        yield chunk
+                
+                if produced:
+                    provider_scorer.record(provider, model, time.time() - started, 'ok')
+                    circuit_breakers.get(provider, model).record_success()
+                    return
+                
+                self._record_attempt(provider, model, started, None)
+                
+            except Exception:
+                self._record_failure(provider, model, started)
+                # Chunks already shown can't be taken back, so only retry if nothing was sent
+                if produced:
+                    raise
+    
     def _procedural_generation(self, content_type: str, level: str, topic: str, seed: str) -> str:
         """Advanced procedural content generation when no AI is available"""
         
-        # Use seed for randomization
-        random.seed(seed)
+        # Own RNG per call: reproducible from the seed, and no reseeding of the
+        # global random module under other sessions' threads
+        rng = random.Random(seed)
         
         # Generate unique content procedurally
         if content_type == 'reading':
-            return self._generate_procedural_reading(level, topic)
+            return self._generate_procedural_reading(level, topic, rng)
         elif content_type == 'listening':
-            return self._generate_procedural_dialogue(level, topic)
+            return self._generate_procedural_dialogue(level, topic, rng)
         elif content_type == 'grammar':
-            return self._generate_procedural_grammar(level, topic)
+            return self._generate_procedural_grammar(level, topic, rng)
         elif content_type == 'speaking':
-            return self._generate_procedural_speaking(level, topic)
+            return self._generate_procedural_speaking(level, topic, rng)
         elif content_type == 'writing':
-            return self._generate_procedural_writing(level, topic)
+            return self._generate_procedural_writing(level, topic, rng)
+        elif content_type == 'daily_bundle':
+            return self._generate_procedural_bundle(level, topic, rng)
         else:
             return self._generate_procedural_generic(level, topic)
     
-    def _generate_procedural_reading(self, level: str, topic: str) -> str:
+    def _generate_procedural_reading(self, level: str, topic: str, rng: Optional[random.Random] = None) -> str:
         """Generate reading content procedurally"""
         
-        # Dynamic vocabulary pools based on level
-        vocab_pools = {
-            'A1': {
-                'verbs': ['sein', 'haben', 'machen', 'gehen', 'kommen', 'essen', 'trinken', 'wohnen', 'arbeiten', 'lernen'],
-                'nouns': ['Haus', 'Familie', 'Freund', 'Arbeit', 'Schule', 'Essen', 'Stadt', 'Tag', 'Zeit', 'Jahr'],
-                'adjectives': ['gut', 'schlecht', 'groß', 'klein', 'neu', 'alt', 'schön', 'teuer', 'billig', 'einfach'],
-                'connectors': ['und', 'aber', 'oder', 'denn', 'also']
-            },
-            'A2': {
-                'verbs': ['können', 'müssen', 'wollen', 'sollen', 'dürfen', 'mögen', 'brauchen', 'kaufen', 'verkaufen', 'reisen'],
-                'nouns': ['Urlaub', 'Reise', 'Hotel', 'Restaurant', 'Geschäft', 'Kunde', 'Problem', 'Lösung', 'Idee', 'Plan'],
-                'adjectives': ['interessant', 'langweilig', 'wichtig', 'möglich', 'schwierig', 'leicht', 'praktisch', 'modern', 'traditionell', 'typisch'],
-                'connectors': ['weil', 'wenn', 'dass', 'obwohl', 'nachdem', 'bevor']
-            },
-            'B1': {
-                'verbs': ['entwickeln', 'verbessern', 'erreichen', 'vermeiden', 'empfehlen', 'besprechen', 'entscheiden', 'vorstellen', 'bewerben', 'organisieren'],
-                'nouns': ['Entwicklung', 'Fortschritt', 'Gesellschaft', 'Umwelt', 'Zukunft', 'Vergangenheit', 'Erfahrung', 'Meinung', 'Vorschlag', 'Möglichkeit'],
-                'adjectives': ['nachhaltig', 'erfolgreich', 'verantwortlich', 'kreativ', 'flexibel', 'zuverlässig', 'effizient', 'notwendig', 'nützlich', 'problematisch'],
-                'connectors': ['sowohl...als auch', 'weder...noch', 'je...desto', 'entweder...oder', 'nicht nur...sondern auch']
-            },
-            'B2': {
-                'verbs': ['analysieren', 'diskutieren', 'argumentieren', 'kritisieren', 'interpretieren', 'präsentieren', 'evaluieren', 'implementieren', 'optimieren', 'koordinieren'],
-                'nouns': ['Analyse', 'Konzept', 'Strategie', 'Innovation', 'Globalisierung', 'Digitalisierung', 'Nachhaltigkeit', 'Kompetenz', 'Herausforderung', 'Perspektive'],
-                'adjectives': ['komplex', 'differenziert', 'kontrovers', 'innovativ', 'strategisch', 'fundamental', 'signifikant', 'relevant', 'authentisch', 'dynamisch'],
-                'connectors': ['darüber hinaus', 'infolgedessen', 'dennoch', 'folglich', 'einerseits...andererseits']
-            }
-        }
+        rng = rng or random.Random()
         
-        pool = vocab_pools.get(level, vocab_pools['A1'])
+        pool = PROCEDURAL_VOCAB.get(level, PROCEDURAL_VOCAB['A1'])
         
         # Generate unique title
         title_templates = [
-            f"{random.choice(['Die', 'Der', 'Das'])} {random.choice(pool['adjectives']).title()} {topic.title()}",
-            f"{topic.title()} - {random.choice(['Eine', 'Ein'])} {random.choice(pool['nouns'])}",
-            f"{random.choice(pool['verbs']).title()} und {random.choice(pool['verbs']).title()}: {topic}"
+            f"{rng.choice(['Die', 'Der', 'Das'])} {rng.choice(pool['adjectives']).title()} {topic.title()}",
+            f"{topic.title()} - {rng.choice(['Eine', 'Ein'])} {rng.choice(pool['nouns'])}",
+            f"{rng.choice(pool['verbs']).title()} und {rng.choice(pool['verbs']).title()}: {topic}"
         ]
         
-        title = random.choice(title_templates)
+        title = rng.choice(title_templates)
         
         # Generate sentences
         sentences = []
         for i in range(8 if level in ['A1', 'A2'] else 12):
             sentence_patterns = [
-                f"{random.choice(['Ich', 'Du', 'Er', 'Sie', 'Wir'])} {random.choice(pool['verbs'])} {random.choice(pool['adjectives'])} {random.choice(pool['nouns'])}.",
-                f"{random.choice(pool['nouns'])} {random.choice(['ist', 'sind'])} {random.choice(pool['adjectives'])} {random.choice(pool['connectors'])} {random.choice(pool['adjectives'])}.",
-                f"{random.choice(['Heute', 'Gestern', 'Morgen'])} {random.choice(pool['verbs'])} {random.choice(['ich', 'wir', 'sie'])} {random.choice(pool['nouns'])}."
+                f"{rng.choice(['Ich', 'Du', 'Er', 'Sie', 'Wir'])} {rng.choice(pool['verbs'])} {rng.choice(pool['adjectives'])} {rng.choice(pool['nouns'])}.",
+                f"{rng.choice(pool['nouns'])} {rng.choice(['ist', 'sind'])} {rng.choice(pool['adjectives'])} {rng.choice(pool['connectors'])} {rng.choice(pool['adjectives'])}.",
+                f"{rng.choice(['Heute', 'Gestern', 'Morgen'])} {rng.choice(pool['verbs'])} {rng.choice(['ich', 'wir', 'sie'])} {rng.choice(pool['nouns'])}."
             ]
-            sentences.append(random.choice(sentence_patterns))
+            sentences.append(rng.choice(sentence_patterns))
         
         text = f"""
         TITLE: {title}
@@ -434,11 +2465,11 @@ class AIContentEngine:
         TEXT: {' '.join(sentences)}
         
         VOCABULARY:
-        - {random.choice(pool['nouns'])}: [translation]
-        - {random.choice(pool['verbs'])}: [translation]
-        - {random.choice(pool['adjectives'])}: [translation]
-        - {random.choice(pool['nouns'])}: [translation]
-        - {random.choice(pool['verbs'])}: [translation]
+        - {rng.choice(pool['nouns'])}: [translation]
+        - {rng.choice(pool['verbs'])}: [translation]
+        - {rng.choice(pool['adjectives'])}: [translation]
+        - {rng.choice(pool['nouns'])}: [translation]
+        - {rng.choice(pool['verbs'])}: [translation]
         
         QUESTIONS:
         1. Was ist das Hauptthema?
@@ -450,12 +2481,14 @@ class AIContentEngine:
         
         return text
     
-    def _generate_procedural_dialogue(self, level: str, topic: str) -> str:
+    def _generate_procedural_dialogue(self, level: str, topic: str, rng: Optional[random.Random] = None) -> str:
         """Generate dialogue procedurally"""
         
+        rng = rng or random.Random()
+        
         # Generate unique character names
         names = ['Anna', 'Ben', 'Clara', 'David', 'Emma', 'Felix', 'Greta', 'Hans', 'Ida', 'Jonas']
-        random.shuffle(names)
+        rng.shuffle(names)
         speaker1, speaker2 = names[0], names[1]
         
         # Generate dialogue based on topic context
@@ -465,37 +2498,43 @@ class AIContentEngine:
         questions = ['Wie geht es dir?', 'Was machst du?', 'Woher kommst du?', 'Was gibt es Neues?']
         responses = ['Gut, danke', 'Sehr gut', 'Es geht', 'Nicht schlecht', 'Prima']
         
-        dialogue_lines.append(f"{speaker1}: {random.choice(greetings)}, {speaker2}!")
-        dialogue_lines.append(f"{speaker2}: {random.choice(greetings)}! {random.choice(questions)}")
-        dialogue_lines.append(f"{speaker1}: {random.choice(responses)}. Und dir?")
+        dialogue_lines.append(f"{speaker1}: {rng.choice(greetings)}, {speaker2}!")
+        dialogue_lines.append(f"{speaker2}: {rng.choice(greetings)}! {rng.choice(questions)}")
+        dialogue_lines.append(f"{speaker1}: {rng.choice(responses)}. Und dir?")
         
         # Add topic-specific content
         for i in range(5):
-            dialogue_lines.append(f"{random.choice([speaker1, speaker2])}: [Topic-specific dialogue about {topic}]")
+            dialogue_lines.append(f"{rng.choice([speaker1, speaker2])}: [Topic-specific dialogue about {topic}]")
         
         dialogue_lines.append(f"{speaker1}: Das war interessant!")
         dialogue_lines.append(f"{speaker2}: Ja, bis bald!")
         
         return "\n".join(dialogue_lines)
     
-    def _generate_procedural_grammar(self, level: str, topic: str) -> str:
+    def _generate_procedural_grammar(self, level: str, topic: str, rng: Optional[random.Random] = None) -> str:
         """Generate grammar exercises procedurally"""
         
         return f"""
         Grammar Exercise: {topic} for {level}
+        Each exercise is uniquely generated based on level {level}.
         
+        Exercises:
         1. Complete with correct form: Ich _____ (verb) ...
         2. Choose correct article: ___ (der/die/das) {topic}
         3. Form correct sentence: [word order exercise]
         4. Transform to past tense: [present tense sentence]
         5. Apply grammar rule: [specific to {topic}]
         
-        Each exercise is uniquely generated based on level {level}.
+        Common Mistakes:
+        - Verb not in second position in main clauses
+        - Wrong article gender for {topic} vocabulary
         """
     
-    def _generate_procedural_speaking(self, level: str, topic: str) -> str:
+    def _generate_procedural_speaking(self, level: str, topic: str, rng: Optional[random.Random] = None) -> str:
         """Generate speaking exercises procedurally"""
         
+        rng = rng or random.Random()
+        
         scenarios = [
             f"You're at a {topic} event. Introduce yourself and ask 3 questions.",
             f"Describe your experience with {topic} in 5 sentences.",
@@ -507,7 +2546,7 @@ class AIContentEngine:
         return f"""
         Speaking Exercise: {topic}
         
-        Scenario: {random.choice(scenarios)}
+        Scenario: {rng.choice(scenarios)}
         
         Practice Points:
         1. Use appropriate greetings for {level}
@@ -517,9 +2556,11 @@ class AIContentEngine:
         5. Include cultural appropriateness
         """
     
-    def _generate_procedural_writing(self, level: str, topic: str) -> str:
+    def _generate_procedural_writing(self, level: str, topic: str, rng: Optional[random.Random] = None) -> str:
         """Generate writing tasks procedurally"""
         
+        rng = rng or random.Random()
+        
         task_types = {
             'A1': ['email to friend', 'postcard', 'simple message', 'shopping list', 'daily routine'],
             'A2': ['invitation', 'complaint letter', 'job application', 'travel blog', 'restaurant review'],
@@ -527,7 +2568,7 @@ class AIContentEngine:
             'B2': ['argumentative essay', 'analysis', 'critical review', 'research summary', 'business proposal']
         }
         
-        task = random.choice(task_types.get(level, task_types['A1']))
+        task = rng.choice(task_types.get(level, task_types['A1']))
         
         return f"""
         Writing Task: {task} about {topic}
@@ -546,6 +2587,23 @@ class AIContentEngine:
         5. Cultural appropriateness
         """
     
+    def _generate_procedural_bundle(self, level: str, topic: str, rng: Optional[random.Random] = None) -> str:
+        """All five skills procedurally, in the same sectioned layout as an AI daily bundle"""
+        
+        rng = rng or random.Random()
+        
+        generators = {
+            'reading': self._generate_procedural_reading,
+            'listening': self._generate_procedural_dialogue,
+            'writing': self._generate_procedural_writing,
+            'speaking': self._generate_procedural_speaking,
+            'grammar': self._generate_procedural_grammar
+        }
+        
+        return '\n\n'.join(
+            f"{BUNDLE_MARKER.format(skill.upper())}\n{generators[skill](level, topic, rng)}" for skill in LESSON_SKILLS
+        )
+    
     def _generate_procedural_generic(self, level: str, topic: str) -> str:
         """Generate generic content procedurally"""
         
@@ -564,18 +2622,500 @@ class AIContentEngine:
         5. Progressive difficulty
         """
 
+# Lesson section grammar: one compiled header pattern per content type, applied once
+# per line. Headers may be plain ('TITLE: x'), bold ('**TITLE:** x', '**Title**: x'),
+# markdown ('## Vocabulary') or numbered ('2. Exercises:').
+#   'line' - the rest of the header line (or the next line if that is empty)
+#   'text' - the rest of the header line plus every following line
+#   'list' - one item per bullet/numbered line; unmarked lines continue the last item
+LESSON_SECTIONS = {
+    'reading': {
+        'fields': {
+            'title': ('line', ['title', 'titel']),
+            'text': ('text', ['text', 'reading text', 'lesetext', 'main text']),
+            'vocabulary': ('list', ['vocabulary', 'vokabeln', 'wortschatz', 'key words', 'vocabulary list']),
+            'questions': ('list', ['questions', 'comprehension questions', 'fragen', 'verständnisfragen']),
+            'cultural_note': ('text', ['cultural_note', 'cultural note', 'cultural fact', 'kulturelle notiz'])
+        },
+        'default': None,
+        'joiner': ' '
+    },
+    'grammar': {
+        'fields': {
+            'explanation': ('text', ['explanation', 'grammar point', 'brief explanation', 'erklärung', 'grammar rule']),
+            'exercises': ('list', ['exercises', 'contextual exercises', 'practice exercises', 'übungen', 'aufgaben']),
+            'application': ('text', ['real-world application', 'application task', 'real-world application task',
+                                     'application', 'anwendung']),
+            'common_mistakes': ('list', ['common mistakes', 'common mistakes to avoid', 'mistakes to avoid',
+                                         'typische fehler', 'häufige fehler'])
+        },
+        'default': 'explanation',
+        'joiner': '\n'
+    },
+    'writing': {
+        'fields': {
+            'task': ('text', ['task', 'writing task', 'scenario', 'aufgabe', 'schreibaufgabe']),
+            'requirements': ('list', ['requirements', 'format requirements', 'scaffolding prompts', 'guiding questions',
+                                      'anforderungen']),
+            'vocabulary': ('list', ['vocabulary', 'vocabulary suggestions', 'useful vocabulary', 'wortschatz']),
+            'evaluation_criteria': ('list', ['evaluation criteria', 'evaluation', 'criteria', 'bewertungskriterien',
+                                             'bewertung'])
+        },
+        'default': 'task',
+        'joiner': '\n'
+    },
+    'speaking': {
+        'fields': {
+            'scenario': ('text', ['scenario', 'role-play', 'role play', 'situation', 'szenario']),
+            'practice_points': ('list', ['prompts', 'progressive prompts', 'practice points', 'speaking prompts',
+                                         'practice prompts', 'sprechanlässe']),
+            'pronunciation_focus': ('list', ['pronunciation focus', 'pronunciation focus points', 'pronunciation',
+                                             'aussprache']),
+            'cultural_tips': ('list', ['cultural communication tips', 'cultural tips', 'communication tips',
+                                       'kulturelle tipps'])
+        },
+        'default': 'scenario',
+        'joiner': '\n'
+    }
+}
+
+HEADER_MARKUP = '#*_ \t0123456789.)'
+HEADER_QUALIFIERS = 'of|for|from|about|on|in|with|to|für|zum|zur|über|mit|von'  # 'Tips for ..', 'Fragen zum Text'
+LIST_ITEM = re.compile(r'^(?:[-*•]|\d{1,2}[.)]|[a-z][.)])\s+(.*)$')
+SPEAKER_LINE = re.compile(r'^\**([A-ZÄÖÜ][\w .\-]{0,30}?)\**\s*:\s*(?:\*\*\s*)?(.+)$')
+
+class SectionParser:
+    """Single linear pass over lesson text, one compiled header match per line"""
+    
+    def __init__(self, fields: Dict[str, Tuple[str, List[str]]], default: Optional[str] = None, joiner: str = '\n'):
+        self.kinds = {name: kind for name, (kind, _) in fields.items()}
+        self.aliases = {alias.lower(): name for name, (_, names) in fields.items() for alias in names}
+        self.default = default
+        self.joiner = joiner
+        names = '|'.join(re.escape(alias) for alias in sorted(self.aliases, key=len, reverse=True))
+        # [#..] [**] [1.] [5] NAME [of/from/.. + up to 4 words] [(..)] [**] then ':' + rest, or end
+        # of line (bare/markdown header) - so the prompts' own '2. 5 contextual exercises' and
+        # 'Brief explanation of the grammar point' match, but an item like '1. Task completion' doesn't
+        header = (
+            r'(?:#{{1,6}}{ws}*)?(?:\*\*|__)?{ws}*(?:\d{{1,2}}[.)]{ws}*)?(?:\d{{1,2}}{ws}+)?(?:\*\*|__)?'
+            r'({names})(?:{ws}+(?:{qualifiers})(?:{ws}+[\w\'-]+){{1,4}})?(?:{ws}*\([^)\n]*\))?{ws}*(?:\*\*|__)?{ws}*'
+            r'(?::{ws}*(?:\*\*|__)?{ws}*(.*)|{ws}*$)'
+        )
+        self.header = re.compile(
+            '^' + header.format(ws=r'\s', names=names, qualifiers=HEADER_QUALIFIERS), re.IGNORECASE
+        )
+        # Cheap pre-check: only a line that starts with an alias once its markup is stripped can match
+        self.prefixes = tuple(self.aliases)
+        self.reach = max(map(len, self.aliases))
+    
+    def start(self) -> Dict:
+        """Empty result plus parse state; feed lines into it, then finish()"""
+        result = {name: [] if kind == 'list' else '' for name, kind in self.kinds.items()}
+        return {'result': result, 'field': self.default}
+    
+    def feed_line(self, state: Dict, line: str):
+        state['field'] = self._scan((line,), state['result'], state['field'])
+    
+    def _scan(self, lines, result: Dict, field: Optional[str]) -> Optional[str]:
+        """Route each line to its section; returns the section still open at the end"""
+        header, prefixes, reach, add = self.header, self.prefixes, self.reach, self._add
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            if line.lstrip(HEADER_MARKUP)[:reach].lower().startswith(prefixes):
+                match = header.match(line)
+                if match:
+                    field = self.aliases[match.group(1).lower()]
+                    rest = (match.group(2) or '').strip().strip('*_').strip()
+                    if rest:
+                        add(result, field, rest)
+                    continue
+            if field is not None:
+                add(result, field, line)
+        return field
+    
+    def _add(self, result: Dict, field: str, line: str):
+        kind = self.kinds[field]
+        if kind == 'line':
+            if not result[field]:
+                result[field] = line
+        elif kind == 'text':
+            result[field] = f"{result[field]}{self.joiner}{line}" if result[field] else line
+        else:
+            item = LIST_ITEM.match(line)
+            if item:
+                result[field].append(item.group(1).strip())
+            elif result[field]:
+                result[field][-1] += ' ' + line
+            else:
+                result[field].append(line)
+    
+    def finish(self, state: Dict, content: str = '') -> Dict:
+        """The parsed dict; with no recognised header, the whole text lands in the default field"""
+        result = state['result']
+        if self.default and not result[self.default] and content.strip():
+            result[self.default] = content.strip()
+        return result
+    
+    def parse(self, content: str) -> Dict:
+        state = self.start()
+        self._scan((content or '').splitlines(), state['result'], state['field'])
+        return self.finish(state, content or '')
+
+LESSON_PARSERS = MappingProxyType({
+    content_type: SectionParser(spec['fields'], spec['default'], spec['joiner'])
+    for content_type, spec in LESSON_SECTIONS.items()
+})
+
+class IncrementalSectionParser:
+    """Push-based SectionParser: feed streamed chunks, get (field, value) events as sections complete
+    
+    Events: a 'line' field once it has its value, a 'text' paragraph at each blank line,
+    a 'list' item once the next item or section starts; close() flushes the rest.
+    """
+    
+    def __init__(self, parser: SectionParser):
+        self.parser = parser
+        self.state = parser.start()
+        self.buffer = ''
+        self.content = []
+        self.emitted = {name: 0 for name in parser.kinds}  # Items, or characters of text, already sent
+    
+    @property
+    def result(self) -> Dict:
+        """Fields parsed so far (complete after close())"""
+        return self.state['result']
+    
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        """Take the next piece of the response; returns the events it completed"""
+        self.content.append(chunk)
+        lines = (self.buffer + chunk).split('\n')
+        self.buffer = lines.pop()  # Partial last line waits for its newline
+        events = []
+        for line in lines:
+            self._line(line, events)
+        return events
+    
+    def close(self) -> List[Tuple[str, object]]:
+        """End of stream: parse the last partial line and flush every open section"""
+        events = []
+        if self.buffer:
+            self._line(self.buffer, events)
+            self.buffer = ''
+        self.parser.finish(self.state, ''.join(self.content))
+        for name in self.parser.kinds:
+            self._flush(name, events)
+        return events
+    
+    def _line(self, line: str, events: List):
+        previous = self.state['field']
+        if not line.strip():
+            if previous is not None and self.parser.kinds[previous] == 'text':
+                self._flush(previous, events)
+            return
+        
+        self.parser.feed_line(self.state, line)
+        field = self.state['field']
+        if previous is not None and previous != field:
+            self._flush(previous, events)
+        if field is None:
+            return
+        
+        kind = self.parser.kinds[field]
+        if kind == 'line':
+            self._flush(field, events)
+        elif kind == 'list':
+            # Every item but the newest is final; unmarked lines may still extend it
+            items = self.result[field]
+            for item in items[self.emitted[field]:-1]:
+                events.append((field, item))
+            self.emitted[field] = max(self.emitted[field], len(items) - 1)
+    
+    def _flush(self, field: str, events: List):
+        value = self.result[field]
+        sent = self.emitted[field]
+        kind = self.parser.kinds[field]
+        if kind == 'list':
+            events.extend((field, item) for item in value[sent:])
+            self.emitted[field] = len(value)
+        elif kind == 'line':
+            if value and not sent:
+                events.append((field, value))
+                self.emitted[field] = 1
+        elif len(value) > sent:
+            events.append((field, value[sent:].lstrip(self.parser.joiner)))
+            self.emitted[field] = len(value)
+
+def parse_dialogue(content: str) -> Dict:
+    """Listening content: the transcript plus its speakers and lines"""
+    lines = []
+    speakers = []
+    for raw in (content or '').splitlines():
+        match = SPEAKER_LINE.match(raw.strip())
+        if match:
+            speaker = match.group(1).strip()
+            lines.append({'speaker': speaker, 'text': match.group(2).strip()})
+            if speaker not in speakers:
+                speakers.append(speaker)
+    return {
+        'dialogue': content,
+        'audio_available': False,  # Will be generated by TTS
+        'transcript': content,
+        'speakers': speakers,
+        'lines': lines
+    }
+
+# Structured output: lesson types answered as one JSON object, checked against a schema built
+# from LESSON_SECTIONS, then rendered back into the section text every parser and cache expects
+LESSON_SCHEMAS = MappingProxyType({
+    content_type: {
+        'type': 'object',
+        'properties': {
+            name: {'type': 'array', 'items': {'type': 'string'}, 'minItems': 1} if kind == 'list' else {'type': 'string'}
+            for name, (kind, _) in spec['fields'].items()
+        },
+        'required': list(spec['fields']),
+        'additionalProperties': False
+    }
+    for content_type, spec in LESSON_SECTIONS.items()
+})
+
+JSON_REPLY = """
+        Reply with only one JSON object, no markdown and no other text, matching this JSON schema:
+        {schema}
+        """
+
+REPAIR_SOURCE = """
+        This {level} German {content_type} lesson about {topic} is missing: {missing}.
+        Lesson so far: {lesson}
+        Write only the missing parts, consistent with the lesson so far.
+        """
+
+def schema_text(schema: Dict) -> str:
+    return json.dumps(schema, ensure_ascii=False, separators=(',', ':'))
+
+def repair_schema(content_type: str, missing: List[str]) -> Dict:
+    """The lesson schema cut down to the fields a repair call asks for"""
+    schema = LESSON_SCHEMAS[content_type]
+    return dict(schema, properties={name: schema['properties'][name] for name in missing}, required=list(missing))
+
+# The free-text prompts with their line-format block swapped for the JSON schema
+STRUCTURED_PROMPTS = MappingProxyType({
+    (content_type, level): PromptTemplate(
+        PROMPT_SOURCES[content_type].split('Format:')[0] + JSON_REPLY,
+        schema=schema_text(schema), **params
+    )
+    for content_type, schema in LESSON_SCHEMAS.items()
+    for level, params in LEVEL_PARAMS.items()
+})
+STRUCTURED_RENDERERS = _renderers(STRUCTURED_PROMPTS)
+REPAIR_PROMPT = PromptTemplate(REPAIR_SOURCE + JSON_REPLY)
+
+def extract_json(text: Optional[str]) -> Optional[Dict]:
+    """The JSON object in a model answer, tolerating code fences and chatter around it"""
+    if not text:
+        return None
+    try:
+        data = json.loads(text)
+    except ValueError:
+        start, end = text.find('{'), text.rfind('}')
+        if start < 0 or end <= start:
+            return None
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+    return data if isinstance(data, dict) else None
+
+def _as_text(value) -> str:
+    if isinstance(value, dict):
+        return ': '.join(_as_text(part) for part in value.values() if part)
+    if isinstance(value, list):
+        return ' '.join(_as_text(part) for part in value if part)
+    return '' if value is None else str(value).strip()
+
+def _split_items(text: str) -> List[str]:
+    """A list sent as one string: one item per marked line, unmarked lines continue the item"""
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        item = LIST_ITEM.match(line)
+        if item:
+            items.append(item.group(1).strip())
+        elif items:
+            items[-1] += ' ' + line
+        else:
+            items.append(line)
+    return items
+
+def validate_lesson(content_type: str, data: Dict) -> Tuple[Dict, List[str]]:
+    """Coerce an answer to the lesson schema; returns the lesson and the required fields still empty
+    
+    Near misses are fixed in place rather than re-asked: a list sent as one string is split
+    into items, {"word": .., "translation": ..} items become "word: translation".
+    """
+    lesson = {}
+    missing = []
+    for name, spec in LESSON_SCHEMAS[content_type]['properties'].items():
+        value = data.get(name)
+        if spec['type'] == 'array':
+            if isinstance(value, str):
+                value = _split_items(value)
+            items = [_as_text(item) for item in value] if isinstance(value, list) else []
+            lesson[name] = [item for item in items if item]
+        else:
+            lesson[name] = _as_text(value)
+        if not lesson[name]:
+            missing.append(name)
+    return lesson, missing
+
+def render_sections(content_type: str, lesson: Dict) -> str:
+    """A lesson dict as 'NAME: ...' section text, which LESSON_PARSERS reads back unchanged"""
+    blocks = []
+    for name, (kind, _) in LESSON_SECTIONS[content_type]['fields'].items():
+        header = name.replace('_', ' ').upper()
+        value = lesson.get(name)
+        if not value:
+            continue
+        if kind == 'list':
+            blocks.append(f"{header}:\n" + '\n'.join(f"- {item}" for item in value))
+        else:
+            blocks.append(f"{header}: {value}")
+    return '\n'.join(blocks)
+
 class DynamicLessonGenerator:
     """Generate complete lessons using AI engine"""
     
-    def __init__(self, ai_engine: AIContentEngine):
+    def __init__(self, ai_engine: AIContentEngine, bank: Optional[CurriculumBank] = curriculum_bank,
+                 curriculum: CurriculumMap = curriculum_map):
         self.ai = ai_engine
+        self.bank = bank  # Pre-generated lessons served first; None = always live
+        self.curriculum = curriculum
     
-    def generate_complete_lesson(self, level: str, skill: str, day: int) -> Dict:
-        """Generate a complete, unique lesson"""
+    def generate_complete_lesson(self, level: str, skill: str, day: int, user: Optional[str] = None,
+                                 fresh: bool = False) -> Dict:
+        """Generate a complete, unique lesson (from the curriculum bank unless fresh is asked for)"""
         
         # Generate topic based on progression
         topic = self.get_topic_for_day(level, day)
         
+        # Generate main content
+        content = None
+        if skill in LESSON_SKILLS:
+            content = None if fresh else self.banked_content(level, topic, skill, day)
+            if content is None:
+                content = self.ai.generate_unique_content(skill, level, topic, user=user)
+        
+        return self.build_lesson(level, skill, day, topic, content)
+    
+    def banked_content(self, level: str, topic: str, skill: str, day: int) -> Optional[str]:
+        return self.bank.get(level, topic, skill, day) if self.bank is not None else None
+    
+    def generate_daily_bundle(self, level: str, day: int, skills: List[str] = None,
+                              user: Optional[str] = None) -> Dict[str, Dict]:
+        """All of a day's lessons from one AI call; skills missing from the answer are generated one by one"""
+        
+        topic = self.get_topic_for_day(level, day)
+        texts = self.generate_daily_texts(level, topic, skills or LESSON_SKILLS, day, user)
+        return {skill: self.build_lesson(level, skill, day, topic, text) for skill, text in texts.items()}
+    
+    def generate_daily_texts(self, level: str, topic: str, skills: List[str], day: int = 0,
+                             user: Optional[str] = None, variant: Optional[int] = None) -> Dict[str, str]:
+        """Raw lesson text per skill: banked where possible, the rest from one daily-bundle call
+        
+        A variant number becomes part of the request context, so distinct variants of one
+        (level, topic) are never coalesced or served from each other's cache slots.
+        """
+        
+        texts = {}
+        for skill in skills:
+            content = self.banked_content(level, topic, skill, day)
+            if content is not None:
+                texts[skill] = content
+        
+        wanted = [skill for skill in skills if skill not in texts]
+        if not wanted:
+            return texts
+        
+        context = {} if wanted == LESSON_SKILLS else {'skills': wanted}
+        if variant is not None:
+            context['variant'] = variant
+        sections = self.split_bundle(self.ai.generate_unique_content('daily_bundle', level, topic, context or None, user=user))
+        
+        missing = []
+        found = {}
+        for skill in wanted:
+            content = sections.get(skill)
+            if content and (skill != 'reading' or self.parse_reading_content(content)['text']):
+                found[skill] = content
+            else:
+                missing.append(skill)
+        
+        # Structured mode: sections the bundle answer left out are re-asked, not lost
+        texts.update(self.ai.complete_lessons(level, topic, found))
+        
+        # Truncated or malformed answer: fill the gaps concurrently, per skill
+        if missing:
+            skill_context = None if variant is None else {'variant': variant}
+            contents = self.ai.generate_many([(skill, level, topic, skill_context) for skill in missing], user=user)
+            for skill, content in zip(missing, contents):
+                texts[skill] = content
+        
+        return texts
+    
+    def split_bundle(self, content: str) -> Dict[str, str]:
+        """Cut a daily bundle into its skill sections ('=== READING ===', also '## Reading')"""
+        
+        sections = {}
+        matches = list(BUNDLE_HEADER.finditer(content or ''))
+        for match, following in zip(matches, matches[1:] + [None]):
+            end = following.start() if following else len(content)
+            text = content[match.end():end].strip()
+            if text:
+                sections.setdefault(match.group(1).lower(), text)
+        
+        return sections
+    
+    def stream_complete_lesson(self, level: str, skill: str, day: int,
+                               fresh: bool = False) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """Stream a lesson: yields (text so far, None) while generating, then (full text, lesson)"""
+        
+        topic = self.get_topic_for_day(level, day)
+        
+        banked = None if fresh else self.banked_content(level, topic, skill, day)
+        if banked is not None:
+            yield banked, self.build_lesson(level, skill, day, topic, banked)
+            return
+        
+        text = ''
+        for chunk in self.ai.generate_unique_content_stream(skill, level, topic):
+            text += chunk
+            yield text, None
+        
+        yield text, self.build_lesson(level, skill, day, topic, text)
+    
+    def stream_lesson_sections(self, level: str, skill: str, day: int,
+                               fresh: bool = False) -> Iterator[Tuple[List[Tuple[str, object]], Optional[Dict]]]:
+        """Stream a lesson as section events: yields (events, None) as chunks arrive, then (last events, lesson)"""
+        
+        parser = IncrementalSectionParser(LESSON_PARSERS[skill]) if skill in LESSON_PARSERS else None
+        seen = 0
+        for text, lesson in self.stream_complete_lesson(level, skill, day, fresh):
+            if parser is None:
+                events = []
+            else:
+                events = parser.feed(text[seen:])
+                seen = len(text)
+                if lesson is not None:
+                    events += parser.close()
+            yield events, lesson
+    
+    def build_lesson(self, level: str, skill: str, day: int, topic: str, content: Optional[str]) -> Dict:
+        """Wrap generated content into a lesson dict"""
+        
         # Generate all components
         lesson = {
             'day': day,
@@ -585,222 +3125,549 @@ class DynamicLessonGenerator:
             'unique_id': hashlib.md5(f"{level}{skill}{day}{datetime.now()}".encode()).hexdigest()
         }
         
-        # Generate main content
+        if content is None:
+            return lesson
+        
         if skill == 'reading':
-            content = self.ai.generate_unique_content('reading', level, topic)
             lesson['content'] = self.parse_reading_content(content)
             
         elif skill == 'listening':
-            content = self.ai.generate_unique_content('listening', level, topic)
             lesson['content'] = self.parse_listening_content(content)
             
         elif skill == 'writing':
-            content = self.ai.generate_unique_content('writing', level, topic)
             lesson['content'] = self.parse_writing_content(content)
             
         elif skill == 'speaking':
-            content = self.ai.generate_unique_content('speaking', level, topic)
             lesson['content'] = self.parse_speaking_content(content)
             
         elif skill == 'grammar':
-            content = self.ai.generate_unique_content('grammar', level, topic)
             lesson['content'] = self.parse_grammar_content(content)
         
         return lesson
     
     def get_topic_for_day(self, level: str, day: int) -> str:
         """Get progressive topic based on day and level"""
-        
-        topic_progression = {
-            'A1': {
-                1: 'Greetings and Introductions',
-                10: 'Family and Friends',
-                20: 'Daily Routine',
-                30: 'Food and Drinks',
-                40: 'Shopping',
-                50: 'Home and Living',
-                60: 'Free Time'
-            },
-            'A2': {
-                1: 'Travel Planning',
-                10: 'At Work',
-                20: 'Health and Body',
-                30: 'Weather and Seasons',
-                40: 'Celebrations',
-                50: 'Past Experiences',
-                60: 'Future Plans'
-            },
-            'B1': {
-                1: 'Education System',
-                10: 'Environment',
-                20: 'Media and News',
-                30: 'Culture Differences',
-                40: 'Technology',
-                50: 'Sports and Fitness',
-                60: 'Career Development'
-            },
-            'B2': {
-                1: 'Global Issues',
-                10: 'Economics',
-                20: 'Politics',
-                30: 'Science',
-                40: 'Art and Literature',
-                50: 'Philosophy',
-                60: 'Future of Society'
-            }
-        }
-        
-        level_topics = topic_progression.get(level, topic_progression['A1'])
-        
-        # Find appropriate topic for the day
-        for day_threshold in sorted(level_topics.keys(), reverse=True):
-            if day >= day_threshold:
-                return level_topics[day_threshold]
-        
-        return level_topics[1]
+        return self.curriculum.topic(level, day)
     
     def parse_reading_content(self, content: str) -> Dict:
         """Parse AI-generated reading content"""
-        
-        parsed = {
-            'title': '',
-            'text': '',
-            'vocabulary': [],
-            'questions': [],
-            'cultural_note': ''
-        }
-        
-        lines = content.split('\n')
-        current_section = None
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('TITLE:'):
-                parsed['title'] = line.replace('TITLE:', '').strip()
-            elif line.startswith('TEXT:'):
-                current_section = 'text'
-                parsed['text'] = line.replace('TEXT:', '').strip()
-            elif line.startswith('VOCABULARY:'):
-                current_section = 'vocabulary'
-            elif line.startswith('QUESTIONS:'):
-                current_section = 'questions'
-            elif line.startswith('CULTURAL_NOTE:'):
-                parsed['cultural_note'] = line.replace('CULTURAL_NOTE:', '').strip()
-            elif line and current_section:
-                if current_section == 'text':
-                    parsed['text'] += ' ' + line
-                elif current_section == 'vocabulary' and line.startswith('-'):
-                    parsed['vocabulary'].append(line[1:].strip())
-                elif current_section == 'questions':
-                    if line[0].isdigit() or line.startswith('-'):
-                        parsed['questions'].append(line.lstrip('0123456789.- '))
-        
-        return parsed
+        return LESSON_PARSERS['reading'].parse(content)
     
     def parse_listening_content(self, content: str) -> Dict:
         """Parse AI-generated listening content"""
-        
-        return {
-            'dialogue': content,
-            'audio_available': False,  # Will be generated by TTS
-            'transcript': content
-        }
+        return parse_dialogue(content)
     
     def parse_writing_content(self, content: str) -> Dict:
         """Parse AI-generated writing content"""
-        
-        return {
-            'task': content,
-            'requirements': [],
-            'evaluation_criteria': []
-        }
+        return LESSON_PARSERS['writing'].parse(content)
     
     def parse_speaking_content(self, content: str) -> Dict:
         """Parse AI-generated speaking content"""
-        
-        return {
-            'scenario': content,
-            'practice_points': [],
-            'pronunciation_focus': []
-        }
+        return LESSON_PARSERS['speaking'].parse(content)
     
     def parse_grammar_content(self, content: str) -> Dict:
         """Parse AI-generated grammar content"""
+        return LESSON_PARSERS['grammar'].parse(content)
+
+# Finished lessons shared by every session of the process: learners at the same level and
+# day are served the same variants, and each learner keeps a pointer to the one they saw
+LESSON_STORE_MAX_BYTES = 32 * 1024 * 1024  # Lessons held in memory, least recently used evicted first
+LESSON_STORE_MAX_POINTERS = 100_000        # Learner pointers kept, least recently used dropped first
+
+class LessonStore:
+    """In-memory lesson variants per (level, day, skill) with LRU eviction and per-user variant pointers"""
+    
+    def __init__(self, max_bytes: int = LESSON_STORE_MAX_BYTES, max_pointers: int = LESSON_STORE_MAX_POINTERS):
+        self.max_bytes = max_bytes
+        self.max_pointers = max_pointers
+        self._entries = OrderedDict()   # (level, day, skill, variant) -> (lesson, size), least recent first
+        self._variants = {}             # (level, day, skill) -> stored variant numbers, oldest first
+        self._next_variant = 0          # Never reused, so a passed-on number can't name a newer lesson
+        self._pointers = OrderedDict()  # (user, level, day, skill) -> variant shown to that learner
+        self._passed = OrderedDict()    # (user, level, day, skill) -> variants the learner asked to replace, LRU
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0  # Served a variant the learner had not been pointed at yet
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, user: str, level: str, day: int, skill: str) -> Optional[Dict]:
+        """The learner's lesson: their variant, else a stored one they haven't passed on (then pointed at)"""
         
-        return {
-            'explanation': content,
-            'exercises': [],
-            'common_mistakes': []
-        }
+        slot = (user, level, day, skill)
+        with self._lock:
+            variant = self._pointers.get(slot)
+            if variant is not None:
+                entry = self._entries.get((level, day, skill, variant))
+                if entry is not None:
+                    self._entries.move_to_end((level, day, skill, variant))
+                    self._pointers.move_to_end(slot)
+                    self.hits += 1
+                    return entry[0]
+                del self._pointers[slot]  # Evicted meanwhile
+            
+            variant = self._unseen(slot)
+            if variant is None:
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end((level, day, skill, variant))
+            self._point(slot, variant)
+            self.hits += 1
+            self.shared_hits += 1
+            return self._entries[level, day, skill, variant][0]
+    
+    def has(self, user: str, level: str, day: int, skill: str) -> bool:
+        """Whether get() would find a lesson, without pointing the learner at it"""
+        slot = (user, level, day, skill)
+        with self._lock:
+            variant = self._pointers.get(slot)
+            if variant is not None and (level, day, skill, variant) in self._entries:
+                return True
+            return self._unseen(slot) is not None
+    
+    def put(self, user: str, level: str, day: int, skill: str, lesson: Dict) -> int:
+        """Store a new variant and point the learner at it, unless they already have one; returns the variant"""
+        
+        size = len(json.dumps(lesson, ensure_ascii=False, default=str).encode('utf-8'))
+        slot = (user, level, day, skill)
+        with self._lock:
+            variant = self._next_variant
+            self._next_variant += 1
+            self._variants.setdefault((level, day, skill), []).append(variant)
+            self._entries[level, day, skill, variant] = (lesson, size)
+            self._total_bytes += size
+            
+            current = self._pointers.get(slot)
+            if current is None or (level, day, skill, current) not in self._entries:
+                self._point(slot, variant)
+            
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                (old_level, old_day, old_skill, old_variant), (_, old_size) = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                self.evictions += 1
+                stored = self._variants[old_level, old_day, old_skill]
+                stored.remove(old_variant)
+                if not stored:
+                    del self._variants[old_level, old_day, old_skill]
+        return variant
+    
+    def release(self, user: str, level: str, day: int, skill: str):
+        """New Lesson: drop only this learner's pointer; the shared variant stays for everyone else"""
+        slot = (user, level, day, skill)
+        with self._lock:
+            variant = self._pointers.pop(slot, None)
+            if variant is not None:
+                # Keep only variants still stored, and as many learner slots as pointers
+                stored = self._variants.get((level, day, skill), ())
+                passed = {old for old in self._passed.get(slot, ()) if old in stored}
+                passed.add(variant)
+                self._passed[slot] = passed
+                self._passed.move_to_end(slot)
+                while len(self._passed) > self.max_pointers:
+                    self._passed.popitem(last=False)
+    
+    def passed(self, user: str, level: str, day: int, skill: str) -> bool:
+        """Whether the learner has asked to replace a lesson here (so the next one should be new)"""
+        with self._lock:
+            return bool(self._passed.get((user, level, day, skill)))
+    
+    def _unseen(self, slot: Tuple) -> Optional[int]:
+        """Oldest stored variant the learner hasn't passed on (lock held)"""
+        _, level, day, skill = slot
+        passed = self._passed.get(slot, ())
+        for variant in self._variants.get((level, day, skill), ()):
+            if variant not in passed:
+                return variant
+        return None
+    
+    def _point(self, slot: Tuple, variant: int):
+        """Set a learner pointer, dropping the least recently used pointers over the cap (lock held)"""
+        self._pointers[slot] = variant
+        self._pointers.move_to_end(slot)
+        while len(self._pointers) > self.max_pointers:
+            old_slot, _ = self._pointers.popitem(last=False)
+            self._passed.pop(old_slot, None)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'pointers': len(self._pointers),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+lesson_store = LessonStore()
+
+# Background lesson prefetch: one small pool for the whole process, so
+# many open sessions can't flood the providers with speculative calls
+PREFETCH_WORKERS = 2
+prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='linguaflow-prefetch')
+
+class LessonPrefetcher:
+    """Pre-generate a learner's upcoming lessons on the shared pool, straight into the shared lesson store"""
+    
+    def __init__(self, generator: DynamicLessonGenerator, pool: ThreadPoolExecutor = None,
+                 store: LessonStore = None):
+        self.generator = generator
+        self.pool = prefetch_pool if pool is None else pool
+        self.store = lesson_store if store is None else store
+        self._pending = {}  # lesson key -> Future
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def lesson_key(level: str, skill: str, day: int) -> str:
+        """Same key the lesson page waits on"""
+        return f"{day}_{skill}_{level}"
+    
+    def schedule(self, level: str, day: int, skills: List[str] = None, user: str = 'guest') -> int:
+        """Queue every skill of a day the learner has no stored lesson for and isn't queued; returns how many"""
+        
+        with self._lock:
+            missing = [
+                skill for skill in skills or LESSON_SKILLS
+                if not self.store.has(user, level, day, skill)
+                and self.lesson_key(level, skill, day) not in self._pending
+            ]
+            if not missing:
+                return 0
+            
+            # Several skills share one daily-bundle call; a lone skill gets its own
+            future = self.pool.submit(self._fill, level, missing, day, user)
+            for skill in missing:
+                self._pending[self.lesson_key(level, skill, day)] = future
+        return len(missing)
+    
+    def _fill(self, level: str, skills: List[str], day: int, user: str):
+        """Worker: generate lessons (session state isn't reachable here, so the user is passed in)"""
+        try:
+            if len(skills) > 1:
+                lessons = self.generator.generate_daily_bundle(level, day, skills, user=user)
+            else:
+                lessons = {skills[0]: self.generator.generate_complete_lesson(level, skills[0], day, user=user)}
+            
+            # Stored for everyone; a lesson the learner generated meanwhile keeps their pointer
+            for skill, lesson in lessons.items():
+                self.store.put(user, level, day, skill, lesson)
+        finally:
+            with self._lock:
+                for skill in skills:
+                    self._pending.pop(self.lesson_key(level, skill, day), None)
+    
+    def wait(self, key: str, timeout: Optional[float] = None) -> bool:
+        """Block until a queued lesson is ready, instead of starting a duplicate call; False if it failed"""
+        
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None:
+            return False
+        try:
+            future.result(timeout)
+            return True
+        except Exception:
+            return False
+    
+    def is_pending(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pending
+    
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+# Tutor memory per session stays flat: the last few turns verbatim (each capped), older
+# turns folded into a rolling summary of fixed size, built on the prefetch pool
+TUTOR_MEMORY_TURNS = 6      # Recent turns kept word for word
+TUTOR_TURN_CHARS = 600      # Per message, in those turns
+TUTOR_SUMMARY_CHARS = 480   # Rolling summary of everything older
+TUTOR_TURN_VERBS = {
+    'question': 'asked',
+    'help_request': 'wanted help with',
+    'correction_request': 'had checked',
+    'general': 'said'
+}
+
+def summary_clause(turn: Dict) -> str:
+    """One short clause for the rolling summary: what the student did, from their first sentence"""
+    first = re.split(r'(?<=[.!?])\s', turn['student'].strip(), maxsplit=1)[0]
+    if len(first) > 70:
+        first = first[:69].rstrip() + '…'
+    return f"{TUTOR_TURN_VERBS.get(turn['type'], 'said')} \"{first}\""
+
+# Tutor prompt context: what the turn knows, packed into a token budget. Items are kept by
+# value (latest message always, then level profile, mistakes, intent, newest turns, summary,
+# older turns) and written back in reading order.
+TUTOR_CONTEXT_TOKENS = 700  # Budget for the packed context, latest message included
+TOKEN_CHARS = 4             # Local estimate: about four characters per token
+TUTOR_HISTORY_CHARS = 300   # Each side of a past turn, as shown in the prompt
+
+def estimate_tokens(text: str) -> int:
+    """Fast local token estimate, no tokenizer: characters / TOKEN_CHARS, rounded up"""
+    return -(-len(text) // TOKEN_CHARS)
+
+def _clip(text: str, chars: int) -> str:
+    text = ' '.join(text.split())
+    return text if len(text) <= chars else text[:chars - 1].rstrip() + '…'
+
+def build_tutor_context(context: Dict, budget: int = TUTOR_CONTEXT_TOKENS) -> str:
+    """Pack a tutor turn's context into at most budget (estimated) tokens, dropping lowest-value items first"""
+    
+    level = context.get('level', 'A1')
+    params = LEVEL_PARAMS.get(level, LEVEL_PARAMS['A1'])
+    message = context.get('message', '')
+    history = context.get('history') or []
+    
+    # (value, reading position, text)
+    items = [(90, 0, f"Learner level {level}: vocabulary {params['vocabulary_range']}, "
+                     f"grammar {params['sentence_complexity']}.")]
+    if context.get('summary'):
+        items.append((45, 1, f"Earlier in this chat: {context['summary']}"))
+    for age, turn in enumerate(reversed(history)):
+        items.append((60 - 5 * age, 2 + len(history) - age,
+                      f"Learner: {_clip(turn['student'], TUTOR_HISTORY_CHARS)}\n"
+                      f"Tutor: {_clip(turn['tutor'], TUTOR_HISTORY_CHARS)}"))
+    if context.get('errors_detected'):
+        items.append((80, 3 + len(history), "Mistakes noticed: " + '; '.join(map(str, context['errors_detected']))))
+    if context.get('message_type', 'general') != 'general' or context.get('topics_mentioned'):
+        about = ', '.join(context.get('topics_mentioned') or [])
+        items.append((70, 4 + len(history),
+                      f"Intent: {context.get('message_type', 'general')}{' about ' + about if about else ''}."))
+    
+    # The latest message always goes in, clipped to half the budget at most
+    latest = f"Latest message: {_clip(message, budget * TOKEN_CHARS // 2)}"
+    left = budget - estimate_tokens(latest)
+    
+    # Most valuable first; everything from the first item that doesn't fit is dropped
+    kept = []
+    for value, position, text in sorted(items, key=lambda item: -item[0]):
+        cost = estimate_tokens(text) + 1  # Plus the line break
+        if cost > left:
+            break
+        kept.append((position, text))
+        left -= cost
+    
+    return '\n'.join([text for _, text in sorted(kept)] + [latest])
+
+# Tutor message lexicon: whole words or phrases (any case) per label; extend freely.
+# Intents are listed in priority order, as are topics (the first found is the primary one).
+MESSAGE_INTENTS = {
+    'help_request': ['help', 'hilfe', 'helfen', 'explain', 'erklären', 'erkläre', 'erklärung', 'erklärst',
+                     "don't understand", 'verstehe nicht', 'how do i', 'wie sagt man'],
+    'correction_request': ['check', 'correct', 'correction', 'korrigieren', 'korrigiere', 'korrektur',
+                           'is this right', 'ist das richtig', 'fix my']
+}
+MESSAGE_TOPICS = {
+    'grammar': ['grammar', 'grammatik', 'verb', 'verbs', 'verben', 'noun', 'nouns', 'nomen', 'substantiv',
+                'artikel', 'article', 'articles', 'case', 'cases', 'kasus', 'dativ', 'dative', 'akkusativ',
+                'accusative', 'genitiv', 'genitive', 'nominativ', 'nominative', 'tense', 'tenses', 'zeitform',
+                'perfekt', 'präteritum', 'konjunktiv', 'subjunctive', 'präposition', 'präpositionen',
+                'preposition', 'prepositions', 'word order', 'wortstellung', 'adjektivendung', 'plural'],
+    'vocabulary': ['word', 'words', 'wort', 'wörter', 'vocabulary', 'vokabular', 'vokabeln', 'mean', 'means',
+                   'meaning', 'bedeutet', 'bedeutung', 'translate', 'translation', 'übersetzen', 'übersetzung',
+                   'synonym', 'synonyme']
+}
+
+MESSAGE_TOKEN = re.compile(r'\w+')
+
+def _is_word_char(char: str) -> bool:
+    """Same test as \\w in MESSAGE_TOKEN"""
+    return char.isalnum() or char == '_'
+
+class KeywordClassifier:
+    """Word-level automaton over a labelled lexicon: one tokenizing scan, a dict step per word
+    
+    Only whole words match ('verb' never fires inside 'Verbindung'). A phrase is keyed by its
+    first word; the rest is a precompiled pattern tried right after it, longest phrase first.
+    """
+    
+    def __init__(self, lexicon: Dict[str, List[str]]):
+        self.labels = tuple(lexicon)
+        self.keys = {}  # first word -> [label of the word alone or None, [(rest of phrase, label)]]
+        for label, entries in lexicon.items():
+            for entry in entries:
+                words = MESSAGE_TOKEN.findall(entry.lower())
+                if not words:
+                    continue
+                key = self.keys.setdefault(words[0], [None, []])
+                if len(words) == 1:
+                    key[0] = key[0] or label
+                else:
+                    rest = re.compile(''.join(rf'\W+{re.escape(word)}' for word in words[1:]) + r'\b')
+                    key[1].append((len(words), rest, label))
+        for key in self.keys.values():
+            key[1] = [(rest, label) for _, rest, label in sorted(key[1], key=lambda phrase: -phrase[0])]
+    
+    def scan(self, text: str) -> List[Tuple[str, int, int]]:
+        """(label, start, end) of every keyword in text, left to right"""
+        
+        lower = text.lower()
+        if len(lower) != len(text):
+            # A few characters lowercase to two; keep those as they are so spans stay aligned
+            lower = ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+        
+        # One C-level tokenize; only the words that are keys cost a Python step
+        keys = self.keys
+        words = MESSAGE_TOKEN.findall(lower)
+        if keys.keys().isdisjoint(words):
+            return []
+        
+        spans = []
+        resume = 0
+        position = 0
+        for word in words:
+            key = keys.get(word)
+            if key is None:
+                continue
+            # Locate this occurrence: the next whole-word hit after the previous keyword
+            start = lower.find(word, position)
+            end = start + len(word)
+            while (start > 0 and _is_word_char(lower[start - 1])) or (end < len(lower) and _is_word_char(lower[end])):
+                start = lower.find(word, start + 1)
+                end = start + len(word)
+            position = end
+            if start < resume:
+                continue
+            for rest, label in key[1]:
+                phrase = rest.match(lower, end)
+                if phrase:
+                    spans.append((label, start, phrase.end()))
+                    resume = phrase.end()
+                    break
+            else:
+                if key[0]:
+                    spans.append((key[0], start, end))
+        return spans
+
+MESSAGE_CLASSIFIER = KeywordClassifier({**MESSAGE_INTENTS, **MESSAGE_TOPICS})
 
 class IntelligentTutor:
     """AI tutor that truly understands and responds intelligently"""
     
-    def __init__(self, ai_engine: AIContentEngine):
+    def __init__(self, ai_engine: AIContentEngine, context_tokens: int = TUTOR_CONTEXT_TOKENS):
         self.ai = ai_engine
-        self.conversation_memory = []
+        self.context_tokens = context_tokens  # Prompt context budget per turn
+        self.conversation_memory = deque(maxlen=TUTOR_MEMORY_TURNS)
+        self.summary = ''  # Older turns, compressed
         self.student_profile = {}
+        self._clauses = deque()
+        self._clause_chars = 0
+        self._topic_counts = {}
+        self._lock = threading.Lock()
     
     def respond_to_student(self, message: str, level: str) -> str:
         """Generate intelligent response based on context"""
         
+        analysis, context = self._prepare_turn(message, level)
+        
+        # Generate appropriate response
+        response = self.ai.generate_unique_content(
+            'tutor_response',
+            level,
+            analysis['primary_topic'],
+            context
+        )
+        
+        self._remember(message, response, analysis)
+        
+        return response
+    
+    def respond_to_student_stream(self, message: str, level: str) -> Iterator[str]:
+        """Stream the tutor's reply chunk by chunk; memory is updated once it is complete"""
+        
+        analysis, context = self._prepare_turn(message, level)
+        
+        chunks = []
+        for chunk in self.ai.generate_unique_content_stream('tutor_response', level, analysis['primary_topic'], context):
+            chunks.append(chunk)
+            yield chunk
+        
+        self._remember(message, ''.join(chunks), analysis)
+    
+    def _prepare_turn(self, message: str, level: str) -> Tuple[Dict, Dict]:
+        """Analyze the message and build the prompt context for this turn"""
+        
         # Analyze the message
         analysis = self.analyze_student_message(message)
         
-        # Build context from conversation history
+        # Build context from recent turns plus the summary of older ones
+        with self._lock:
+            history = list(self.conversation_memory)
+            summary = self.summary
         context = {
             'level': level,
-            'history': self.conversation_memory[-5:],
+            'message': message,
+            'token_budget': self.context_tokens,
+            'history': history,
+            'summary': summary,
             'message_type': analysis['type'],
             'topics_mentioned': analysis['topics'],
             'errors_detected': analysis['errors']
         }
         
-        # Generate appropriate response
-        response = self.ai.generate_unique_content(
-            'tutor_response',
-            level,
-            analysis['primary_topic'],
-            context
-        )
+        return analysis, context
+    
+    def _remember(self, message: str, response: str, analysis: Dict):
+        """Add a turn to the ring buffer; a turn it pushes out is folded into the summary right away"""
         
-        # Update conversation memory
-        self.conversation_memory.append({
-            'student': message,
-            'tutor': response,
-            'timestamp': datetime.now()
-        })
+        turn = {
+            'student': message[:TUTOR_TURN_CHARS],
+            'tutor': response[:TUTOR_TURN_CHARS],
+            'type': analysis['type'],
+            'topic': analysis['primary_topic']
+        }
         
-        return response
+        # The summary is extractive and a few string ops long: no worker to wait behind
+        with self._lock:
+            if len(self.conversation_memory) == self.conversation_memory.maxlen:
+                self._summarize(self.conversation_memory[0])
+            self.conversation_memory.append(turn)
+    
+    def _summarize(self, turn: Dict):
+        """Fold an evicted turn into the summary, dropping its oldest clauses past the size cap (lock held)"""
+        
+        clause = summary_clause(turn)
+        if turn['topic'] != 'general':
+            self._topic_counts[turn['topic']] = self._topic_counts.get(turn['topic'], 0) + 1
+        self._clauses.append(clause)
+        self._clause_chars += len(clause) + 2
+        
+        topics = ', '.join(f"{topic} ({count})" for topic, count in self._topic_counts.items())
+        prefix = f"Topics so far: {topics}. " if topics else ''
+        while self._clauses and len(prefix) + self._clause_chars > TUTOR_SUMMARY_CHARS:
+            self._clause_chars -= len(self._clauses.popleft()) + 2
+        self.summary = f"{prefix}Earlier the student " + '; '.join(self._clauses) + '.'
     
     def analyze_student_message(self, message: str) -> Dict:
-        """Analyze student message for intent and content"""
+        """Analyze student message for intent and content (one pass of the compiled classifier)"""
+        
+        spans = MESSAGE_CLASSIFIER.scan(message)
         
         analysis = {
-            'type': 'general',
+            'type': 'question' if '?' in message else 'general',
             'primary_topic': 'general',
             'topics': [],
-            'errors': []
+            'errors': [],
+            'spans': spans
         }
+        if not spans:
+            return analysis
         
-        # Detect message type
-        if '?' in message:
-            analysis['type'] = 'question'
-        elif any(word in message.lower() for word in ['help', 'hilfe', 'explain', 'erklären']):
-            analysis['type'] = 'help_request'
-        elif any(word in message.lower() for word in ['check', 'correct', 'korrigieren']):
-            analysis['type'] = 'correction_request'
-        
-        # Detect topics
-        grammar_keywords = ['grammar', 'grammatik', 'verb', 'noun', 'artikel', 'case', 'kasus']
-        vocab_keywords = ['word', 'wort', 'vocabulary', 'vokabular', 'mean', 'bedeutet']
-        
-        if any(word in message.lower() for word in grammar_keywords):
-            analysis['topics'].append('grammar')
-            analysis['primary_topic'] = 'grammar'
-        elif any(word in message.lower() for word in vocab_keywords):
-            analysis['topics'].append('vocabulary')
-            analysis['primary_topic'] = 'vocabulary'
+        # Lexicon order is priority order: first intent found sets the type, first topic is primary
+        found = {label for label, _, _ in spans}
+        if analysis['type'] == 'general':
+            for intent in MESSAGE_INTENTS:
+                if intent in found:
+                    analysis['type'] = intent
+                    break
+        
+        analysis['topics'] = [topic for topic in MESSAGE_TOPICS if topic in found]
+        if analysis['topics']:
+            analysis['primary_topic'] = analysis['topics'][0]
         
         return analysis
     
@@ -850,17 +3717,19 @@ class AdaptiveExamSystem:
             'sections': []
         }
         
-        # Generate sections with emphasis on weak areas
-        for skill in ['reading', 'listening', 'grammar', 'writing']:
-            section_difficulty = 'challenging' if skill in weak_areas else 'standard'
-            
-            section_content = self.ai.generate_unique_content(
+        # Generate sections with emphasis on weak areas, all concurrently
+        skills = ['reading', 'listening', 'grammar', 'writing']
+        section_contents = self.ai.generate_many([
+            (
                 f'exam_{skill}',
                 level,
                 f'{skill}_assessment',
-                {'difficulty': section_difficulty}
+                {'difficulty': 'challenging' if skill in weak_areas else 'standard'}
             )
-            
+            for skill in skills
+        ])
+        
+        for skill, section_content in zip(skills, section_contents):
             exam['sections'].append({
                 'skill': skill,
                 'content': section_content,
@@ -965,7 +3834,7 @@ def translate_text(text: str, source_lang: str, target_lang: str) -> Dict:
         if email:
             params['de'] = email  # Add email for 10,000 words/day limit
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_pool.get(url, params=params, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -1015,7 +3884,7 @@ def translate_text(text: str, source_lang: str, target_lang: str) -> Dict:
                     'format': 'text'
                 }
                 
-                response = requests.post(url, json=data, timeout=5)
+                response = http_pool.post(url, json=data, timeout=5)
                 
                 if response.status_code == 200:
                     result = response.json()
@@ -1176,11 +4045,8 @@ def get_personalized_recommendations(level: str, weak_skills: List[str]) -> List
     
     # Use AI to generate personalized recommendations if available
     if 'ai_engine' in st.session_state:
-        for skill in weak_skills:
-            prompt = f"Generate one specific, actionable recommendation for improving {skill} at {level} level."
-            rec = st.session_state.ai_engine.generate_unique_content('recommendation', level, skill)
-            if rec:
-                recommendations.append(rec)
+        recs = st.session_state.ai_engine.generate_many([('recommendation', level, skill) for skill in weak_skills])
+        recommendations = [rec for rec in recs if rec]
     
     # Add general recommendations
     if not recommendations:
@@ -1198,8 +4064,40 @@ if 'ai_engine' not in st.session_state:
 
 # Export everything
 __all__ = [
+    'ConnectionPool',
+    'http_pool',
+    'EngineLoop',
+    'engine_loop',
+    'AsyncHTTPClient',
+    'async_http',
+    'ProviderScorer',
+    'provider_scorer',
+    'CircuitBreaker',
+    'BreakerRegistry',
+    'circuit_breakers',
+    'GenerationCache',
+    'generation_cache',
+    'SingleFlight',
+    'inflight_requests',
+    'TokenBucket',
+    'RequestGovernor',
+    'request_governor',
+    'FixtureStore',
+    'ReplayMiss',
     'AIContentEngine',
+    'CurriculumBank',
+    'curriculum_bank',
+    'CurriculumMap',
+    'curriculum_map',
+    'SectionParser',
+    'IncrementalSectionParser',
     'DynamicLessonGenerator',
+    'LessonStore',
+    'lesson_store',
+    'LessonPrefetcher',
+    'ProceduralBulkGenerator',
+    'bulk_procedural',
+    'KeywordClassifier',
     'IntelligentTutor',
     'AdaptiveExamSystem',
     'translate_text',
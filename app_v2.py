@@ -22,12 +22,20 @@ import plotly.graph_objects as go
 from ai_module import (
     AIContentEngine,
     DynamicLessonGenerator,
+    LessonPrefetcher,
+    lesson_store,
     IntelligentTutor,
     AdaptiveExamSystem,
     translate_text,
     get_example_sentences,
     calculate_skill_score,
-    get_personalized_recommendations
+    get_personalized_recommendations,
+    async_http,
+    circuit_breakers,
+    provider_scorer,
+    generation_cache,
+    inflight_requests,
+    request_governor
 )
 
 # ==========================================
@@ -375,7 +383,6 @@ if 'initialized' not in st.session_state:
     st.session_state.achievements = []
     st.session_state.user_name = ""
     st.session_state.completed_exercises = []
-    st.session_state.lesson_cache = {}
     st.session_state.exam_history = []
     st.session_state.skill_scores = {
         'Speaking': 0,
@@ -394,6 +401,7 @@ if 'initialized' not in st.session_state:
     # Initialize AI systems
     st.session_state.ai_engine = AIContentEngine()
     st.session_state.lesson_generator = DynamicLessonGenerator(st.session_state.ai_engine)
+    st.session_state.lesson_prefetcher = LessonPrefetcher(st.session_state.lesson_generator)
     st.session_state.ai_tutor = IntelligentTutor(st.session_state.ai_engine)
     st.session_state.exam_system = AdaptiveExamSystem(st.session_state.ai_engine)
 
@@ -769,6 +777,7 @@ def page_dashboard():
             st.session_state.daily_complete = True
             st.session_state.current_day += 1
             save_user_progress()
+            prefetch_lessons(st.session_state.current_day)
         
         # Personalized recommendations
         if st.session_state.completed_exercises:
@@ -1033,20 +1042,41 @@ def page_todays_lesson():
         format_func=lambda x: skill_descriptions[x]
     )
     
-    # Generate or retrieve lesson
-    lesson_key = f"{st.session_state.current_day}_{selected_skill}_{st.session_state.user_level}"
+    # Generate or retrieve lesson: the shared store serves lessons other learners already generated
+    level = st.session_state.user_level
+    day = st.session_state.current_day
+    user = st.session_state.get('user_name') or 'guest'
+    lesson_key = LessonPrefetcher.lesson_key(level, selected_skill, day)
+    
+    prefetcher = st.session_state.lesson_prefetcher
+    
+    if not lesson_store.has(user, level, day, selected_skill) and prefetcher.is_pending(lesson_key):
+        # Already being generated in the background: wait for it rather than asking twice
+        with st.spinner(f"🤖 Finishing your {selected_skill} lesson..."):
+            prefetcher.wait(lesson_key)
+    
+    lesson = lesson_store.get(user, level, day, selected_skill)
+    if lesson is None:
+        # After "New Lesson", a live one rather than the same banked text again
+        fresh = lesson_store.passed(user, level, day, selected_skill)
+        if selected_skill == "reading":
+            # Stream the text in so the learner can start reading right away
+            lesson = stream_reading_lesson(st.session_state.user_level, st.session_state.current_day, fresh)
+        else:
+            with st.spinner(f"🤖 AI is creating your personalized {selected_skill} lesson..."):
+                # Generate lesson using AI
+                lesson = st.session_state.lesson_generator.generate_complete_lesson(
+                    st.session_state.user_level,
+                    selected_skill,
+                    st.session_state.current_day,
+                    fresh=fresh
+                )
+        lesson_store.put(user, level, day, selected_skill, lesson)
     
-    if lesson_key not in st.session_state.lesson_cache:
-        with st.spinner(f"🤖 AI is creating your personalized {selected_skill} lesson..."):
-            # Generate lesson using AI
-            lesson = st.session_state.lesson_generator.generate_complete_lesson(
-                st.session_state.user_level,
-                selected_skill,
-                st.session_state.current_day
-            )
-            st.session_state.lesson_cache[lesson_key] = lesson
-    else:
-        lesson = st.session_state.lesson_cache[lesson_key]
+    # Prepare the rest of today's skills, and tomorrow once today is done
+    prefetch_lessons(st.session_state.current_day)
+    if len(st.session_state.daily_tasks_completed) >= 5:
+        prefetch_lessons(st.session_state.current_day + 1)
     
     # Display lesson in beautiful card
     st.markdown(f"<div class='lesson-card'>", unsafe_allow_html=True)
@@ -1069,8 +1099,8 @@ def page_todays_lesson():
     col1, col2, col3 = st.columns([1, 1, 2])
     with col1:
         if st.button("🔄 New Lesson", use_container_width=True):
-            if lesson_key in st.session_state.lesson_cache:
-                del st.session_state.lesson_cache[lesson_key]
+            # Only this learner moves on; the lesson stays shared with everyone else
+            lesson_store.release(user, level, day, selected_skill)
             st.rerun()
     
     with col2:
@@ -1084,6 +1114,49 @@ def page_todays_lesson():
                 - 📖 German Grammar Guide
                 """)
 
+def prefetch_lessons(day):
+    """Generate a day's remaining lessons in the background so the next skill opens instantly"""
+    if day > 180:
+        return
+    st.session_state.lesson_prefetcher.schedule(
+        st.session_state.user_level,
+        day,
+        user=st.session_state.get('user_name') or 'guest'
+    )
+
+def stream_reading_lesson(level, day, fresh=False):
+    """Generate a reading lesson, rendering each section as soon as the stream completes it"""
+    generator = st.session_state.lesson_generator
+    preview = st.empty()
+    preview.info("🤖 AI is creating your personalized reading lesson...")
+    
+    title = ''
+    paragraphs = []
+    vocabulary = []
+    lesson = None
+    for events, lesson in generator.stream_lesson_sections(level, "reading", day, fresh):
+        if lesson is not None or not events:
+            continue
+        for field, value in events:
+            if field == 'title':
+                title = value
+            elif field == 'text':
+                paragraphs.append(value)
+            elif field == 'vocabulary':
+                vocabulary.append(value)
+        
+        body = ''.join(f"<p>{paragraph}</p>" for paragraph in paragraphs)
+        words = ''.join(f"\n- {word}" for word in vocabulary)
+        preview.markdown(
+            f"## {title or 'Reading Practice'}\n\n"
+            f"<div class='content-box'>{body} ▌</div>\n{words}",
+            unsafe_allow_html=True
+        )
+    
+    # The finished lesson is rendered by display_reading_lesson
+    preview.empty()
+    return lesson
+
 def display_reading_lesson(lesson):
     """Display reading lesson with full features"""
     content = lesson.get('content', {})
@@ -1148,6 +1221,16 @@ def display_writing_lesson(lesson):
     task = content.get('task', 'Write about your day in German')
     st.info(task)
     
+    if content.get('requirements'):
+        st.markdown("### Requirements:")
+        for requirement in content['requirements']:
+            st.write(f"• {requirement}")
+    
+    if content.get('evaluation_criteria'):
+        with st.expander("How your text is evaluated"):
+            for criterion in content['evaluation_criteria']:
+                st.write(f"• {criterion}")
+    
     # Writing area
     user_text = st.text_area(
         "Your writing:",
@@ -1242,8 +1325,8 @@ def display_speaking_lesson(lesson):
     scenario = content.get('scenario', 'Practice speaking German')
     st.info(scenario)
     
-    # Practice sentences
-    practice_sentences = [
+    # Practice sentences: the lesson's own prompts when it has them
+    practice_sentences = content.get('practice_points') or [
         "Guten Tag, wie geht es Ihnen?",
         "Ich komme aus Deutschland.",
         "Können Sie mir bitte helfen?",
@@ -1664,12 +1747,18 @@ def page_ai_guru():
             # Add user message
             st.session_state.chat_history.append({"role": "user", "content": user_input})
             
-            # Generate AI response
-            with st.spinner("🤔 AI Guru is thinking..."):
-                response = st.session_state.ai_tutor.respond_to_student(
-                    user_input,
-                    st.session_state.user_level or "A1"
-                )
+            # Stream the AI response into the chat as it is generated
+            reply = st.empty()
+            reply.markdown("<div class='chat-message ai-message'>🤔 AI Guru is thinking...</div>",
+                           unsafe_allow_html=True)
+            response = ""
+            for chunk in st.session_state.ai_tutor.respond_to_student_stream(
+                user_input,
+                st.session_state.user_level or "A1"
+            ):
+                response += chunk
+                reply.markdown(f"<div class='chat-message ai-message'>{response} ▌</div>",
+                               unsafe_allow_html=True)
             
             # Add AI response
             st.session_state.chat_history.append({"role": "assistant", "content": response})
@@ -2429,6 +2518,7 @@ def page_settings():
                 # Reinitialize AI providers
                 st.session_state.ai_engine = AIContentEngine()
                 st.session_state.lesson_generator = DynamicLessonGenerator(st.session_state.ai_engine)
+                st.session_state.lesson_prefetcher = LessonPrefetcher(st.session_state.lesson_generator)
                 st.session_state.ai_tutor = IntelligentTutor(st.session_state.ai_engine)
                 
                 st.success("API keys saved successfully!")
@@ -2447,6 +2537,43 @@ def page_settings():
                     st.write(f"Test response: {response[:100]}...")
                 else:
                     st.warning("⚠️ Using fallback mode. Add API keys for full features.")
+        
+        # Endpoint health: breaker state and live score per provider/model
+        breaker_rows = circuit_breakers.snapshot()
+        if breaker_rows:
+            state_icons = {'closed': '🟢 closed', 'half_open': '🟡 half-open', 'open': '🔴 open'}
+            scores = {(row['provider'], row['model']): row['score'] for row in provider_scorer.snapshot()}
+            st.markdown("**Endpoint Health:**")
+            st.dataframe(pd.DataFrame([
+                {
+                    'Provider': row['provider'],
+                    'Model': row['model'],
+                    'Breaker': state_icons.get(row['state'], row['state']),
+                    'Failures': row['failures'],
+                    'Retry in (s)': row['retry_in'],
+                    'Score': round(scores.get((row['provider'], row['model']), 0.0), 2)
+                }
+                for row in breaker_rows
+            ]), use_container_width=True, hide_index=True)
+        
+        # Daily request budget for this learner and each configured key
+        st.markdown("**Budget Today:**")
+        for row in request_governor.usage(st.session_state.user_name or 'guest', st.session_state.api_keys):
+            st.progress(
+                min(row['used'] / row['daily'], 1.0),
+                text=f"{row['name']}: {row['used']}/{row['daily']} requests · {row['tokens']} available right now"
+            )
+        
+        # Connection reuse across provider calls
+        with st.expander("🔌 Connection Pool"):
+            pool_stats = async_http.stats()
+            if pool_stats:
+                for host, stats in pool_stats.items():
+                    st.write(f"**{host}** (pool size {stats['pool_size']}): "
+                             f"{stats['requests']} requests, {stats['hits']} reused connections, "
+                             f"{stats['misses']} new handshakes")
+            else:
+                st.caption("No provider calls made yet.")
     
     with tabs[1]:  # Profile
         st.markdown("### User Profile")
@@ -2552,6 +2679,41 @@ def page_settings():
         auto_play_audio = st.checkbox("Auto-play audio", value=False)
         audio_repetitions = st.number_input("Audio repetitions", min_value=1, max_value=5, value=1)
         
+        st.markdown("### AI Content")
+        
+        use_cache = st.checkbox(
+            "Reuse cached AI lessons",
+            value=st.session_state.get('generation_cache', False),
+            help="Rotates through a few stored variants per lesson instead of calling the AI every time. Much faster and saves API quota."
+        )
+        if use_cache != st.session_state.get('generation_cache', False):
+            st.session_state.generation_cache = use_cache
+            st.session_state.ai_engine.cache_enabled = use_cache
+        
+        structured = st.checkbox(
+            "Structured AI lessons (JSON mode)",
+            value=st.session_state.get('structured_output', True),
+            help="Asks the AI for a checked JSON lesson and re-asks only for missing parts, instead of showing a half-empty lesson."
+        )
+        if structured != st.session_state.get('structured_output', True):
+            st.session_state.structured_output = structured
+            st.session_state.ai_engine.structured = structured
+        
+        repair_stats = st.session_state.ai_engine.structured_stats
+        if repair_stats['lessons']:
+            st.caption(f"Structured lessons: {repair_stats['valid']} valid first time, "
+                       f"{repair_stats['repaired']} repaired, {repair_stats['incomplete']} incomplete")
+        
+        cache_stats = generation_cache.stats()
+        flight_stats = inflight_requests.stats()
+        st.caption(f"Cache: {cache_stats['entries']} variants, {cache_stats['bytes'] / 1024:.0f} KB, "
+                   f"{cache_stats['hits']} hits / {cache_stats['misses']} misses this run · "
+                   f"{flight_stats['coalesced']} duplicate requests shared "
+                   f"{flight_stats['upstream_calls']} upstream calls")
+        store_stats = lesson_store.stats()
+        st.caption(f"Shared lessons: {store_stats['entries']} in memory ({store_stats['bytes'] / 1024:.0f} KB), "
+                   f"{store_stats['shared_hits']} served from other learners' generations")
+        
         if st.button("Save Preferences", type="primary"):
             st.success("Preferences saved!")
     
@@ -0,0 +1,512 @@
+"""
+Benchmarks for LinguaFlow's AI engine
+Run one or more by name; all run offline (no provider keys needed).
+
+    python benchmarks.py --list
+    python benchmarks.py procedural-threads
+    python benchmarks.py procedural-threads --executor process --workers 1,2,4,8
+    python benchmarks.py procedural-bulk --count 100000
+    python benchmarks.py prompt-build
+    python benchmarks.py parse-lessons --count 50000
+    python benchmarks.py structured-lessons --count 200 --drift 0.3
+    python benchmarks.py topic-lookup --count 1000000
+    python benchmarks.py classify-messages --count 200000 --chat-dir user_data
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import ai_module
+
+PROCEDURAL_TYPES = ['reading', 'listening', 'grammar', 'speaking', 'writing']
+LEVELS = ['A1', 'A2', 'B1', 'B2']
+
+_engine = None
+
+
+def _procedural_engine() -> ai_module.AIContentEngine:
+    """One engine per process; procedural generation needs no providers"""
+    global _engine
+    if _engine is None:
+        _engine = ai_module.AIContentEngine(cache_enabled=False)
+    return _engine
+
+
+def _procedural_item(i: int):
+    """The i-th (content_type, level, topic, seed) of the benchmark workload"""
+    return PROCEDURAL_TYPES[i % len(PROCEDURAL_TYPES)], LEVELS[i % len(LEVELS)], 'Reisen', f"bench-{i}"
+
+
+def _procedural_chunk(bounds) -> list:
+    engine = _procedural_engine()
+    return [engine._procedural_generation(*_procedural_item(i)) for i in range(*bounds)]
+
+
+def _chunks(count: int, parts: int):
+    size = -(-count // parts)
+    return [(start, min(start + size, count)) for start in range(0, count, size)]
+
+
+def bench_procedural_threads(args):
+    """Procedural texts/sec at 1..N workers, checking every output against a single-threaded run"""
+
+    count = args.count
+    reference = _procedural_chunk((0, count))  # Also warms up this process's engine
+
+    pool_class = ThreadPoolExecutor if args.executor == 'thread' else ProcessPoolExecutor
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print(f"procedural-threads: {count} texts, {args.executor} workers, "
+          f"{os.cpu_count()} CPUs, GIL {'on' if gil else 'off'}")
+
+    baseline = None
+    for workers in args.workers:
+        with pool_class(max_workers=workers) as pool:
+            # Start every worker (and import ai_module in child processes) before timing
+            list(pool.map(_procedural_chunk, [(0, 1)] * workers))
+
+            started = time.perf_counter()
+            results = [text for chunk in pool.map(_procedural_chunk, _chunks(count, workers)) for text in chunk]
+            elapsed = time.perf_counter() - started
+
+        rate = count / elapsed
+        baseline = baseline or rate
+        deterministic = results == reference
+        print(f"  {workers:>3} workers: {rate:>10,.0f} texts/s  x{rate / baseline:4.2f}  "
+              f"{'identical' if deterministic else 'MISMATCH'} to serial output")
+        if not deterministic:
+            raise SystemExit('Seeded output changed under concurrency')
+
+
+def bench_procedural_bulk(args):
+    """Reading texts/sec: per-call generator vs the vectorised bulk generator, per level"""
+
+    engine = _procedural_engine()
+    bulk = ai_module.bulk_procedural
+    count = args.count
+    print(f"procedural-bulk: {count} reading texts per level, one core")
+
+    for level in LEVELS:
+        bulk.readings(level, 'Reisen', 1)  # Build this level's tables outside the timing
+
+        started = time.perf_counter()
+        for i in range(count):
+            engine._procedural_generation('reading', level, 'Reisen', f"bench-{i}")
+        per_call = count / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        texts = bulk.readings(level, 'Reisen', count, seed=0)
+        rate = len(texts) / (time.perf_counter() - started)
+
+        print(f"  {level}: per-call {per_call:>9,.0f} texts/s   bulk {rate:>10,.0f} texts/s  x{rate / per_call:.0f}")
+
+
+def _legacy_reading_prompt(level: str, topic: str, seed: str) -> str:
+    """The reading prompt as it was built before templates were precompiled (baseline only)"""
+    level_params = {
+        'A1': {'vocabulary_range': '500-750 words', 'sentence_complexity': 'simple present, basic past',
+               'max_sentence_length': 10, 'topics': 'daily life, family, hobbies, food, basic activities'},
+        'A2': {'vocabulary_range': '1000-1500 words', 'sentence_complexity': 'present perfect, modal verbs, conjunctions',
+               'max_sentence_length': 15, 'topics': 'travel, work, health, shopping, past experiences'},
+        'B1': {'vocabulary_range': '2000-2500 words', 'sentence_complexity': 'subjunctive, relative clauses, passive voice',
+               'max_sentence_length': 20, 'topics': 'education, environment, culture, opinions, future plans'},
+        'B2': {'vocabulary_range': '3000-4000 words', 'sentence_complexity': 'all tenses, complex subordinate clauses',
+               'max_sentence_length': 25, 'topics': 'abstract concepts, current events, technology, society'}
+    }
+    params = level_params.get(level, level_params['A1'])
+    return f"""
+            Generate a UNIQUE German reading text. Use seed {seed} for uniqueness.
+            
+            Requirements:
+            - Level: {level}
+            - Topic: {topic}
+            - Length: {150 if level in ['A1', 'A2'] else 250} words
+            - Vocabulary: {params['vocabulary_range']}
+            - Sentence complexity: {params['sentence_complexity']}
+            - Include variety in sentence structures
+            
+            Create a completely original text about {topic} that has never been written before.
+            Include cultural elements specific to German-speaking countries.
+            Make it engaging and educational.
+            
+            Format:
+            TITLE: [Creative title related to {topic}]
+            TEXT: [The main text]
+            VOCABULARY: [5 key words with English translations]
+            QUESTIONS: [3 comprehension questions]
+            CULTURAL_NOTE: [One interesting cultural fact related to the text]
+            """
+
+
+def _approx_tokens(text: str) -> int:
+    """BPE-style estimate: words, punctuation and each run of 4 spaces count as tokens"""
+    return len(re.findall(r"\w+|[^\w\s]| {4}|\n", text))
+
+
+def bench_prompt_build(args):
+    """Reading prompt build: legacy per-call dict + indented f-string vs precompiled compact template"""
+
+    engine = _procedural_engine()
+    builders = {
+        'legacy': lambda i: _legacy_reading_prompt(LEVELS[i % 4], 'Reisen', f"seed-{i}"),
+        'precompiled': lambda i: engine._build_dynamic_prompt('reading', LEVELS[i % 4], 'Reisen', f"seed-{i}", None)
+    }
+    count = args.count
+    print(f"prompt-build: {count} reading prompts")
+
+    for name, build in builders.items():
+        started = time.perf_counter()
+        for i in range(count):
+            build(i)
+        elapsed = time.perf_counter() - started
+
+        # Peak bytes one call holds at once: temporaries (like a rebuilt dict) plus the prompt
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        prompt = build(1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        allocated = peak - baseline
+
+        print(f"  {name:12} {elapsed / count * 1e6:6.2f} us/call  {allocated:6,} B peak  "
+              f"{len(prompt):5} chars  ~{_approx_tokens(prompt)} tokens")
+
+
+def _legacy_parse_reading(content: str) -> dict:
+    """The reading parser as it was before the compiled section parser (baseline only)"""
+    parsed = {'title': '', 'text': '', 'vocabulary': [], 'questions': [], 'cultural_note': ''}
+    current_section = None
+    for line in content.split('\n'):
+        line = line.strip()
+        if line.startswith('TITLE:'):
+            parsed['title'] = line.replace('TITLE:', '').strip()
+        elif line.startswith('TEXT:'):
+            current_section = 'text'
+            parsed['text'] = line.replace('TEXT:', '').strip()
+        elif line.startswith('VOCABULARY:'):
+            current_section = 'vocabulary'
+        elif line.startswith('QUESTIONS:'):
+            current_section = 'questions'
+        elif line.startswith('CULTURAL_NOTE:'):
+            parsed['cultural_note'] = line.replace('CULTURAL_NOTE:', '').strip()
+        elif line and current_section:
+            if current_section == 'text':
+                parsed['text'] += ' ' + line
+            elif current_section == 'vocabulary' and line.startswith('-'):
+                parsed['vocabulary'].append(line[1:].strip())
+            elif current_section == 'questions':
+                if line[0].isdigit() or line.startswith('-'):
+                    parsed['questions'].append(line.lstrip('0123456789.- '))
+    return parsed
+
+
+# Header spellings models actually answer with, applied to the plain 'NAME:' reading format
+READING_STYLES = {
+    'plain': lambda name, label: f"{name}:",
+    'bold': lambda name, label: f"**{name}:**",
+    'markdown': lambda name, label: f"## {label}\n",
+    'bold-title': lambda name, label: f"**{label}**:"
+}
+
+
+def _reading_variant(text: str, style: str) -> str:
+    """Rewrite a procedural reading's 'NAME:' headers in another header style"""
+    spell = READING_STYLES[style]
+    for name in ('TITLE', 'TEXT', 'VOCABULARY', 'QUESTIONS', 'CULTURAL_NOTE'):
+        text = text.replace(f"{name}:", spell(name, name.replace('_', ' ').title()))
+    return text
+
+
+# Grammar and speaking answers headed the way their own prompts list the parts:
+# numbered, with a count and trailing words, and lettered exercise items
+PROMPT_HEADED = {
+    'grammar': (
+        "1. Brief explanation of the grammar point\n{topic}: the dative marks the indirect object.\n"
+        "2. 5 contextual exercises (not just fill-in-the-blank)\n"
+        "a) Ich gebe ___ Mann das Buch.\nb) Sie hilft ___ Kind.\nc) Wir danken ___ Lehrerin ({i}).\n"
+        "3. Real-world application task\nWrite a thank-you note about {topic}.\n"
+        "4. Common mistakes to avoid\n- Accusative after helfen\n- Forgetting the -n in plural dative"
+    ),
+    'speaking': (
+        "Scenario: At a bakery in {topic} ({i}).\n"
+        "5 progressive prompts from easy to challenging:\n1. Greet the baker.\n2. Ask for bread.\n"
+        "3. Ask what is fresh today.\n"
+        "Pronunciation focus points\n- ü in Brötchen\n- ch in ich\n"
+        "Cultural communication tips\n- Say Tschüss when leaving"
+    )
+}
+
+
+def _lesson_corpus(count: int) -> list:
+    """(content_type, text) pairs: bulk readings in every header style plus procedural other skills"""
+    engine = _procedural_engine()
+    styles = list(READING_STYLES)
+    corpus = []
+    for level in LEVELS:
+        readings = ai_module.bulk_procedural.readings(level, 'Reisen', count // 8, seed=1)
+        corpus += [('reading', _reading_variant(text, styles[i % len(styles)])) for i, text in enumerate(readings)]
+        for i in range(count // 8):
+            skill = ('grammar', 'writing', 'speaking')[i % 3]
+            corpus.append((skill, engine._procedural_generation(skill, level, 'Reisen', f"bench-{i}")))
+        for i in range(count // 16):
+            skill = ('grammar', 'speaking')[i % 2]
+            corpus.append((skill, PROMPT_HEADED[skill].format(topic='Reisen', i=i)))
+    return corpus
+
+
+def bench_parse_lessons(args):
+    """Lesson parsing docs/sec and MB/sec: legacy multi-branch reading parser vs compiled section parser"""
+
+    corpus = _lesson_corpus(args.count)
+    readings = [text for content_type, text in corpus if content_type == 'reading']
+    reading_bytes = sum(len(text.encode()) for text in readings)
+    corpus_bytes = sum(len(text.encode()) for _, text in corpus)
+    print(f"parse-lessons: {len(corpus)} documents ({corpus_bytes / 1e6:.1f} MB), "
+          f"{len(readings)} readings in {len(READING_STYLES)} header styles")
+
+    def report(name, parse, documents, size):
+        started = time.perf_counter()
+        results = [parse(document) for document in documents]
+        elapsed = time.perf_counter() - started
+        complete = sum(1 for r in results if r['title'] and r['text'] and r['vocabulary'] and r['questions'])
+        print(f"  {name:22} {len(documents) / elapsed:>9,.0f} docs/s  {size / elapsed / 1e6:6.1f} MB/s  "
+              f"{complete / len(documents):6.1%} complete")
+
+    parser = ai_module.LESSON_PARSERS['reading']
+    report('reading legacy', _legacy_parse_reading, readings, reading_bytes)
+    report('reading section', parser.parse, readings, reading_bytes)
+
+    parsers = ai_module.LESSON_PARSERS
+    headed = [(content_type, text) for content_type, text in corpus if text.startswith(('1. Brief', 'Scenario: At'))]
+    if headed:
+        # Every list section found, not swallowed by the section before it
+        complete = sum(
+            1 for content_type, text in headed
+            if all(value for value in parsers[content_type].parse(text).values())
+        )
+        print(f"  {'prompt-headed':22} {len(headed):>9,} docs          {complete / len(headed):6.1%} complete")
+
+    started = time.perf_counter()
+    for content_type, text in corpus:
+        parsers[content_type].parse(text)
+    elapsed = time.perf_counter() - started
+    print(f"  {'all types section':22} {len(corpus) / elapsed:>9,.0f} docs/s  {corpus_bytes / elapsed / 1e6:6.1f} MB/s")
+
+
+def _standin_engine(port: int, structured: bool) -> ai_module.AIContentEngine:
+    """An engine with every provider pointed at the local stand-in, one provider at a time"""
+    engine = ai_module.AIContentEngine(dispatch_mode='sequential', cache_enabled=False, structured=structured)
+    for config in engine.providers.values():
+        config['key'] = ai_module.OFFLINE_API_KEY
+        config['url'] = ai_module.rebase_url(config['url'], f"http://127.0.0.1:{port}")
+    return engine
+
+
+def bench_structured_lessons(args):
+    """Provider calls per usable reading lesson when answers drift: free text + New Lesson vs JSON mode + repair"""
+
+    from mock_provider_server import LatencyModel, StandInProvider, start_in_thread
+
+    # The benchmark is not a learner: no rate limits, and nothing charged to the real ledger
+    unlimited = {'rpm': 1_000_000, 'daily': 1_000_000}
+    ai_module.request_governor = ai_module.RequestGovernor(
+        None, provider_limits={name: unlimited for name in ai_module.PROVIDER_LIMITS}, user_limits=unlimited
+    )
+
+    count = args.count
+    print(f"structured-lessons: {count} reading lessons, {args.drift:.0%} of answers drop vocabulary and questions")
+
+    for mode, structured in (('free text', False), ('JSON + repair', True)):
+        provider = StandInProvider(LatencyModel('fixed:0'), drift_rate=args.drift, seed=1)
+        server = start_in_thread(provider)
+        engine = _standin_engine(server.server_port, structured)
+        usable = shown_broken = 0
+
+        started = time.perf_counter()
+        for i in range(count):
+            # A lesson that renders without vocabulary or questions costs the learner a "New Lesson" click
+            for attempt in range(1 + args.retries):
+                text = engine.generate_unique_content('reading', LEVELS[i % 4], 'Reisen', user='bench')
+                lesson = ai_module.LESSON_PARSERS['reading'].parse(text)
+                if all(lesson[name] for name in ('title', 'text', 'vocabulary', 'questions')):
+                    usable += 1
+                    break
+                shown_broken += 1
+        elapsed = time.perf_counter() - started
+        server.shutdown()
+
+        calls = provider.counters['requests']
+        print(f"  {mode:14} {calls:6} calls  {calls / max(usable, 1):4.2f} per usable lesson  "
+              f"{shown_broken:5} broken lessons shown  {provider.counters['chars'] / 1e3:7.0f} k chars  "
+              f"{usable}/{count} usable  {elapsed:5.1f}s")
+        if structured:
+            print(f"  {'':14} {engine.structured_stats}")
+
+
+def _legacy_topic_for_day(progression: dict, level: str, day: int) -> str:
+    """get_topic_for_day as it was before the compiled map: reverse-sorted linear scan (baseline only)"""
+    level_topics = progression.get(level, progression['A1'])
+    for day_threshold in sorted(level_topics.keys(), reverse=True):
+        if day >= day_threshold:
+            return level_topics[day_threshold]
+    return level_topics[1]
+
+
+def bench_topic_lookup(args):
+    """Topic-for-day lookups/sec: legacy sorted scan vs bisect over compiled thresholds, built-in and 180-topic maps"""
+
+    count = args.count
+    days = [1 + i * 7919 % 180 for i in range(count)]  # Spread over the whole path
+    levels = [LEVELS[i % 4] for i in range(count)]
+    daily = {level: {day: f"{level} topic {day}" for day in range(1, 181)} for level in LEVELS}
+    print(f"topic-lookup: {count:,} lookups")
+
+    for name, progression in (('built-in', ai_module.TOPIC_PROGRESSION), ('180 topics', daily)):
+        compiled = ai_module.CurriculumMap(progression)
+        runs = {
+            'legacy scan': lambda level, day: _legacy_topic_for_day(progression, level, day),
+            'bisect': compiled.topic
+        }
+        results = {}
+        for run, lookup in runs.items():
+            started = time.perf_counter()
+            results[run] = [lookup(level, day) for level, day in zip(levels, days)]
+            elapsed = time.perf_counter() - started
+            print(f"  {name:11} {run:12} {elapsed / count * 1e9:7.0f} ns/lookup  {count / elapsed:>12,.0f} lookups/s")
+        if results['legacy scan'] != results['bisect']:
+            raise SystemExit(f"Compiled map disagrees with the legacy lookup on the {name} map")
+
+
+def _legacy_analyze_message(message: str) -> dict:
+    """analyze_student_message as it was before the compiled classifier (baseline only)"""
+    analysis = {'type': 'general', 'primary_topic': 'general', 'topics': [], 'errors': []}
+    if '?' in message:
+        analysis['type'] = 'question'
+    elif any(word in message.lower() for word in ['help', 'hilfe', 'explain', 'erklären']):
+        analysis['type'] = 'help_request'
+    elif any(word in message.lower() for word in ['check', 'correct', 'korrigieren']):
+        analysis['type'] = 'correction_request'
+    grammar_keywords = ['grammar', 'grammatik', 'verb', 'noun', 'artikel', 'case', 'kasus']
+    vocab_keywords = ['word', 'wort', 'vocabulary', 'vokabular', 'mean', 'bedeutet']
+    if any(word in message.lower() for word in grammar_keywords):
+        analysis['topics'].append('grammar')
+        analysis['primary_topic'] = 'grammar'
+    elif any(word in message.lower() for word in vocab_keywords):
+        analysis['topics'].append('vocabulary')
+        analysis['primary_topic'] = 'vocabulary'
+    return analysis
+
+
+def _substring_analyze(message: str) -> dict:
+    """The legacy substring technique over the full classifier lexicon, lowercasing once (baseline only)"""
+    lower = message.lower()
+    found = [label for lexicon in (ai_module.MESSAGE_INTENTS, ai_module.MESSAGE_TOPICS)
+             for label, words in lexicon.items() if any(word in lower for word in words)]
+    topics = [label for label in found if label in ai_module.MESSAGE_TOPICS]
+    intent = next((label for label in found if label in ai_module.MESSAGE_INTENTS), 'general')
+    return {'type': 'question' if '?' in message else intent,
+            'primary_topic': topics[0] if topics else 'general', 'topics': topics, 'errors': []}
+
+
+# Learner messages in the tutor chat's style, including substring traps ('Verbindung', 'Antwort')
+CHAT_MESSAGES = [
+    "Kannst du mir den Dativ erklären?",
+    "Was bedeutet das Wort Gemütlichkeit",
+    "Please check my sentence: Ich habe gestern ins Kino gegangen.",
+    "Die Verbindung war heute sehr schlecht, ich konnte nicht lernen.",
+    "Danke für deine Antwort, das war hilfreich!",
+    "I don't understand the word order in subordinate clauses",
+    "Hallo! Ich heiße Tony und ich wohne in Berlin seit drei Jahren.",
+    "Wie sagt man 'to look forward to' auf Deutsch",
+    "Korrigiere bitte: Der Frau gibt dem Mann ein Buch.",
+    "Ich finde die Adjektivendungen wirklich schwierig, besonders im Genitiv."
+]
+
+
+def _chat_corpus(count: int, chat_dir: str) -> list:
+    """Learner messages from saved progress files (chat_history), topped up with CHAT_MESSAGES to count"""
+    stored = []
+    for path in sorted(glob.glob(os.path.join(chat_dir, '*.json'))):
+        try:
+            with open(path, encoding='utf-8') as f:
+                history = json.load(f).get('chat_history') or []
+        except (OSError, ValueError, AttributeError):
+            continue
+        stored += [turn['content'] for turn in history if turn.get('role') == 'user' and turn.get('content')]
+    pool = stored + CHAT_MESSAGES
+    return stored, [pool[i % len(pool)] for i in range(count)]
+
+
+def bench_classify_messages(args):
+    """Tutor message analysis msgs/sec and MB/sec: legacy substring scans vs compiled word-boundary classifier"""
+
+    stored, corpus = _chat_corpus(args.count, args.chat_dir)
+    size = sum(len(message.encode()) for message in corpus)
+    tutor = ai_module.IntelligentTutor.__new__(ai_module.IntelligentTutor)  # Analysis needs no engine
+    print(f"classify-messages: {len(corpus):,} messages ({size / 1e6:.1f} MB), "
+          f"{len(stored)} stored chat messages from {args.chat_dir}")
+
+    results = {}
+    runs = {
+        'legacy': _legacy_analyze_message,
+        'substring, full lexicon': _substring_analyze,
+        'compiled, full lexicon': tutor.analyze_student_message
+    }
+    for name, analyze in runs.items():
+        started = time.perf_counter()
+        results[name] = [analyze(message) for message in corpus]
+        elapsed = time.perf_counter() - started
+        print(f"  {name:24} {len(corpus) / elapsed:>10,.0f} msgs/s  {size / elapsed / 1e6:6.2f} MB/s")
+
+    # Where the two disagree on topics, show the message once
+    shown = set()
+    for message, old, new in zip(corpus, results['legacy'], results['compiled, full lexicon']):
+        if old['topics'] != new['topics'] and message not in shown:
+            shown.add(message)
+            print(f"  topics {old['topics']} -> {new['topics']}: {message!r}")
+
+
+BENCHMARKS = {
+    'procedural-threads': bench_procedural_threads,
+    'procedural-bulk': bench_procedural_bulk,
+    'prompt-build': bench_prompt_build,
+    'parse-lessons': bench_parse_lessons,
+    'structured-lessons': bench_structured_lessons,
+    'topic-lookup': bench_topic_lookup,
+    'classify-messages': bench_classify_messages
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='LinguaFlow engine benchmarks')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run (default: all)')
+    parser.add_argument('--list', action='store_true', help='List benchmarks and exit')
+    parser.add_argument('--count', type=int, default=20000, help='Items per run')
+    parser.add_argument('--workers', default='1,2,4,8', help='Worker counts to compare')
+    parser.add_argument('--executor', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--drift', type=float, default=0.3, help='Share of stand-in answers missing sections')
+    parser.add_argument('--chat-dir', default='user_data', help='Saved progress files to read chat messages from')
+    parser.add_argument('--retries', type=int, default=3, help='"New Lesson" clicks before a learner gives up')
+    args = parser.parse_args()
+    args.workers = [int(n) for n in args.workers.split(',')]
+
+    if args.list:
+        for name, bench in BENCHMARKS.items():
+            print(f"{name:24} {bench.__doc__}")
+        return
+
+    for name in args.names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            parser.error(f"Unknown benchmark: {name}")
+        BENCHMARKS[name](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Build the offline curriculum bank for LinguaFlow
+Pre-generates several AI variants of every (level, topic, skill) lesson so
+DynamicLessonGenerator can serve the 180-day path without live calls.
+
+    OPENROUTER_API_KEY=... python build_curriculum.py --variants 3
+    python build_curriculum.py --levels A1,A2 --resume
+    LINGUAFLOW_CURRICULUM_MAP=topics.json python build_curriculum.py
+
+Each (level, topic) variant costs one daily-bundle call for all five skills.
+Provider rate limits and daily budgets still apply; rerun with --resume to
+continue a partial build. Answers that fall back to procedural text are not stored.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ai_module import (
+    AIContentEngine,
+    CurriculumBank,
+    DynamicLessonGenerator,
+    CURRICULUM_DIR,
+    LESSON_SKILLS,
+    request_governor
+)
+
+LEVELS = ['A1', 'A2', 'B1', 'B2']
+TOTAL_DAYS = 180
+
+# Key variables for each provider, as on the Settings page
+API_KEY_ENV = {
+    'openrouter': 'OPENROUTER_API_KEY',
+    'huggingface': 'HUGGINGFACE_API_KEY',
+    'together': 'TOGETHER_API_KEY'
+}
+
+
+def curriculum_topics(generator: DynamicLessonGenerator, level: str, days: int = TOTAL_DAYS):
+    """Distinct topics of a level's path, in the order the days reach them"""
+    return generator.curriculum.topics(level, days)
+
+
+def dedupe(texts):
+    """Each entry's texts with repeats removed, first occurrence kept"""
+    return {key: list(dict.fromkeys(variants)) for key, variants in texts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-generate the LinguaFlow curriculum bank')
+    parser.add_argument('--out', default=str(CURRICULUM_DIR), help='Bank directory (LINGUAFLOW_CURRICULUM_DIR)')
+    parser.add_argument('--levels', default=','.join(LEVELS))
+    parser.add_argument('--variants', type=int, default=3, help='Lessons per (level, topic, skill)')
+    parser.add_argument('--workers', type=int, default=2, help='Concurrent daily-bundle calls')
+    parser.add_argument('--timeout', type=float, default=120.0, help='Seconds per bundle call')
+    parser.add_argument('--resume', action='store_true', help='Keep existing texts and only fill missing variants')
+    args = parser.parse_args()
+
+    engine = AIContentEngine(cache_enabled=False, timeout=args.timeout, procedural_fallback=False)
+    for name, variable in API_KEY_ENV.items():
+        if os.environ.get(variable):
+            engine.providers[name]['key'] = os.environ[variable]
+    if not any(config['key'] for config in engine.providers.values()):
+        parser.error('No provider configured: set an API key variable or LINGUAFLOW_PROVIDER_BASE_URL')
+
+    # The build is not a learner: only the providers' own limits apply
+    request_governor.user_limits = {'rpm': 600, 'daily': 1_000_000}
+    request_governor.queue_wait = 60.0
+
+    generator = DynamicLessonGenerator(engine, bank=None)
+    bank = CurriculumBank(args.out)
+    texts = dedupe(bank.texts()) if args.resume else {}
+
+    # One job per missing (level, topic, variant), covering the skills that still lack it
+    jobs = []
+    for level in args.levels.split(','):
+        for topic in curriculum_topics(generator, level):
+            for variant in range(args.variants):
+                skills = [
+                    skill for skill in LESSON_SKILLS
+                    if len(texts.get(bank.entry_key(level, topic, skill), [])) <= variant
+                ]
+                if skills:
+                    jobs.append((level, topic, variant, skills))
+
+    print(f"{len(jobs)} bundle calls for {args.levels} into {args.out}")
+    started = time.time()
+    stored = failed = duplicates = 0
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(generator.generate_daily_texts, level, topic, skills,
+                        user='curriculum-build', variant=variant): (level, topic)
+            for level, topic, variant, skills in jobs
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            level, topic = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"  {level} {topic}: {e}")
+                continue
+
+            for skill, text in results.items():
+                if not text:
+                    failed += 1
+                    continue
+                # Providers can repeat themselves; a duplicate is not another variant
+                stored_texts = texts.setdefault(bank.entry_key(level, topic, skill), [])
+                if text in stored_texts:
+                    duplicates += 1
+                else:
+                    stored_texts.append(text)
+                    stored += 1
+
+            print(f"  [{done}/{len(jobs)}] {level} {topic}")
+            # Save as we go so an interrupted build can --resume
+            if done % 10 == 0:
+                bank.write(texts)
+
+    bank.write(texts)
+    stats = bank.stats()
+    print(f"Stored {stored} texts ({failed} failed, {duplicates} duplicates dropped) in {time.time() - started:.0f}s; "
+          f"bank has {stats['texts']} texts in {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""
+Local stand-in for the LinguaFlow AI providers
+Speaks the OpenRouter/Together chat-completions shape (plain and SSE streaming)
+and the HuggingFace inference shape, so the engine can be load-tested offline.
+
+    python mock_provider_server.py --port 8765 --latency lognormal:0.3:0.5 --error-rate 0.05
+    LINGUAFLOW_PROVIDER_BASE_URL=http://127.0.0.1:8765 streamlit run app_v2.py
+
+Answers come from a body template (default: a reading lesson in the engine's format),
+or from fixtures recorded with LINGUAFLOW_PROVIDER_MODE=record (--fixtures DIR).
+JSON-mode requests (response_format, or a schema in the prompt) get the lesson as a JSON
+object holding the schema's required keys. --drift-rate drops sections from that share of
+answers, like models that wander off the requested format.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+from typing import Dict, Optional
+
+DEFAULT_TEMPLATE = """TITLE: $topic in meinem Alltag
+TEXT: Ich heiße Anna und ich wohne in Leipzig. Heute erzähle ich von $topic. Am Morgen trinke ich Kaffee und lese die Zeitung. Am Nachmittag treffe ich meine Freunde im Park. Wir sprechen über $topic und lachen viel. Am Abend koche ich mit meiner Familie.
+VOCABULARY:
+- der Alltag - everyday life
+- die Zeitung - newspaper
+- treffen - to meet
+- lachen - to laugh
+- kochen - to cook
+QUESTIONS:
+1. Wo wohnt Anna?
+2. Was macht Anna am Nachmittag?
+3. Mit wem kocht Anna am Abend?
+CULTURAL_NOTE: In Deutschland ist Kaffee und Kuchen am Nachmittag eine beliebte Tradition.
+(level $level, model $model, response $n)"""
+
+# The default lesson as JSON-mode answers carry it
+DEFAULT_JSON = {
+    'title': '$topic in meinem Alltag',
+    'text': 'Ich heiße Anna und ich wohne in Leipzig. Heute erzähle ich von $topic. Am Morgen trinke ich Kaffee '
+            'und lese die Zeitung. Am Nachmittag treffe ich meine Freunde im Park. Wir sprechen über $topic und '
+            'lachen viel. Am Abend koche ich mit meiner Familie. (level $level, model $model, response $n)',
+    'vocabulary': ['der Alltag - everyday life', 'die Zeitung - newspaper', 'treffen - to meet',
+                   'lachen - to laugh', 'kochen - to cook'],
+    'questions': ['Wo wohnt Anna?', 'Was macht Anna am Nachmittag?', 'Mit wem kocht Anna am Abend?'],
+    'cultural_note': 'In Deutschland ist Kaffee und Kuchen am Nachmittag eine beliebte Tradition.'
+}
+
+# What a drifting answer leaves out: the text template from this header on, or these JSON keys
+DRIFT_CUT = 'VOCABULARY:'
+DRIFT_KEYS = ('vocabulary', 'questions')
+
+# Error bodies the real endpoints send, by status
+ERROR_BODIES = {
+    429: {'error': {'message': 'Rate limit exceeded', 'code': 429}},
+    500: {'error': {'message': 'Internal server error', 'code': 500}},
+    503: {'error': 'Model is currently loading', 'estimated_time': 20.0}
+}
+
+
+class LatencyModel:
+    """Sampled response delay: fixed:S, uniform:LO:HI, normal:MEAN:SD or lognormal:MU:SIGMA (seconds)"""
+
+    def __init__(self, spec: str = 'fixed:0', seed: Optional[int] = None):
+        kind, _, args = spec.partition(':')
+        self.kind = kind
+        self.args = [float(arg) for arg in args.split(':') if arg]
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+        if kind not in expected or len(self.args) != expected[kind]:
+            raise ValueError(f"Bad latency spec: {spec}")
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == 'fixed':
+                return self.args[0]
+            if self.kind == 'uniform':
+                return self.rng.uniform(*self.args)
+            if self.kind == 'normal':
+                return max(self.rng.gauss(*self.args), 0.0)
+            # lognormal: MU is the median in seconds, SIGMA the spread of the log
+            return self.args[0] * self.rng.lognormvariate(0.0, self.args[1])
+
+
+class StandInProvider:
+    """Behaviour shared by all request handlers: latency, fault injection and answer bodies"""
+
+    def __init__(self, latency: LatencyModel, error_rate: float = 0.0, error_statuses=(500,),
+                 empty_rate: float = 0.0, hang_rate: float = 0.0, hang_seconds: float = 30.0,
+                 template: str = DEFAULT_TEMPLATE, chunk_size: int = 24, chunk_delay: float = 0.0,
+                 fixtures=None, seed: Optional[int] = None, drift_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.empty_rate = empty_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.template = Template(template)
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.fixtures = fixtures
+        self.drift_rate = drift_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counters = {'requests': 0, 'ok': 0, 'errors': 0, 'empty': 0, 'hangs': 0, 'streams': 0, 'replayed': 0,
+                         'json': 0, 'drifted': 0, 'chars': 0}
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def fault(self) -> Optional[str]:
+        """Draw the fate of one request: None (answer normally), 'error', 'empty' or 'hang'"""
+        with self._lock:
+            roll = self.rng.random()
+        if roll < self.error_rate:
+            return 'error'
+        roll -= self.error_rate
+        if roll < self.empty_rate:
+            return 'empty'
+        roll -= self.empty_rate
+        if roll < self.hang_rate:
+            return 'hang'
+        return None
+
+    def error_status(self) -> int:
+        with self._lock:
+            return self.rng.choice(self.error_statuses)
+
+    def drifts(self) -> bool:
+        with self._lock:
+            return self.rng.random() < self.drift_rate
+
+    def text_for(self, prompt: str, model: str, schema: Optional[Dict] = None) -> str:
+        """Fill the body template (or, in JSON mode, the schema's keys) from the prompt's level/topic lines"""
+
+        level = re.search(r'Level:\s*(\S+)', prompt) or re.search(r'\b([ABC][12])\b', prompt)
+        topic = re.search(r'(?:Topic|Situation|Theme):\s*([^\n]+)', prompt) or re.search(r' about (.+?)(?: is|\.|\n)', prompt)
+        fields = {
+            'level': level.group(1) if level else 'A1',
+            'topic': topic.group(1).strip() if topic else 'Deutsch',
+            'model': model,
+            'n': self.counters['requests']
+        }
+        drift = self.drifts()
+        if drift:
+            self.count('drifted')
+
+        if schema is None:
+            text = self.template.safe_substitute(**fields)
+            return text.split(DRIFT_CUT)[0].rstrip() if drift else text
+
+        self.count('json')
+        keys = [key for key in schema.get('required', DEFAULT_JSON) if key in DEFAULT_JSON]
+        if drift:
+            keys = [key for key in keys if key not in DRIFT_KEYS]
+        return json.dumps({
+            key: json.loads(Template(json.dumps(DEFAULT_JSON[key], ensure_ascii=False)).safe_substitute(**fields))
+            for key in keys
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def schema_for(payload: Dict, prompt: str) -> Optional[Dict]:
+        """The JSON schema a request asks for: its response_format, else one quoted in the prompt"""
+        response_format = payload.get('response_format') or {}
+        schema = response_format.get('schema') or (response_format.get('json_schema') or {}).get('schema')
+        if schema:
+            return schema
+        quoted = re.search(r'"required":\s*(\[[^\]]*\])', prompt)
+        if quoted:
+            return {'required': json.loads(quoted.group(1))}
+        return {} if response_format else None
+
+    def recorded(self, path: str, payload: Dict) -> Optional[Dict]:
+        """A recorded fixture for this request, if a fixture store was given"""
+        if self.fixtures is None:
+            return None
+        try:
+            fixture = self.fixtures.replay(path, payload)
+        except LookupError:
+            return None
+        self.count('replayed')
+        return fixture
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Routes: POST */chat/completions, POST */models/<model>, GET /stats"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real endpoints
+    provider: StandInProvider = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.provider.counters)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON'})
+            return
+
+        provider = self.provider
+        provider.count('requests')
+
+        if self.path.endswith('/chat/completions'):
+            model = payload.get('model', '')
+            messages = payload.get('messages') or [{}]
+            prompt = messages[-1].get('content', '')
+        elif '/models/' in self.path:
+            model = self.path.rsplit('/models/', 1)[-1]
+            prompt = payload.get('inputs', '')
+        else:
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        time.sleep(provider.latency.sample())
+
+        fault = provider.fault()
+        if fault == 'hang':
+            provider.count('hangs')
+            time.sleep(provider.hang_seconds)
+        elif fault == 'error':
+            provider.count('errors')
+            status = provider.error_status()
+            self._send_json(status, ERROR_BODIES.get(status, {'error': {'code': status}}))
+            return
+
+        fixture = provider.recorded(self.path, payload)
+        if fixture is not None and 'lines' in fixture:
+            self._send_lines(fixture['lines'])
+            return
+        if fixture is not None:
+            self._send_json(200, fixture['body'])
+            return
+
+        text = '' if fault == 'empty' else provider.text_for(prompt, model, provider.schema_for(payload, prompt))
+        provider.count('empty' if fault == 'empty' else 'ok')
+        with provider._lock:
+            provider.counters['chars'] += len(text)
+
+        if '/models/' in self.path:
+            self._send_json(200, [{'generated_text': text}])
+        elif payload.get('stream'):
+            self._send_stream(model, text)
+        else:
+            self._send_json(200, {
+                'id': f"standin-{provider.counters['requests']}",
+                'object': 'chat.completion',
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}]
+            })
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model: str, text: str):
+        """OpenAI-style SSE: one delta event per chunk, then [DONE]"""
+
+        self.provider.count('streams')
+        size = self.provider.chunk_size
+        lines = [': stand-in stream']
+        for start in range(0, len(text), size):
+            event = {'model': model, 'choices': [{'index': 0, 'delta': {'content': text[start:start + size]}}]}
+            lines.append('data: ' + json.dumps(event, ensure_ascii=False))
+        lines.append('data: [DONE]')
+        self._send_lines(lines, self.provider.chunk_delay)
+
+    def _send_lines(self, lines, delay: float = 0.0):
+        """Chunked transfer so the client sees each line as soon as it is written"""
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for line in lines:
+            data = (line + '\n').encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b'\r\n')
+            self.wfile.flush()
+            if delay and line.startswith('data:'):
+                time.sleep(delay)
+        self.wfile.write(b'0\r\n\r\n')
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8765, provider: StandInProvider = None) -> ThreadingHTTPServer:
+    """Build (but don't start) a stand-in server; port 0 picks a free port"""
+
+    handler = type('BoundStandInHandler', (StandInHandler,), {'provider': provider or StandInProvider(LatencyModel())})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(provider: StandInProvider = None, port: int = 0) -> ThreadingHTTPServer:
+    """Serve from a daemon thread, e.g. inside a benchmark; base URL is http://127.0.0.1:<server.server_port>"""
+
+    server = make_server(port=port, provider=provider)
+    threading.Thread(target=server.serve_forever, name='linguaflow-standin', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the LinguaFlow AI providers')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='fixed:0.2',
+                        help='fixed:S | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with an HTTP error')
+    parser.add_argument('--error-status', default='500', help='Comma-separated statuses to pick from, e.g. 429,500,503')
+    parser.add_argument('--empty-rate', type=float, default=0.0, help='Share of requests answered with empty text')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Share of requests that stall past client timeouts')
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    parser.add_argument('--body-file', help='Answer template ($level, $topic, $model, $n); default is a reading lesson')
+    parser.add_argument('--chunk-size', type=int, default=24, help='Characters per SSE delta')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Seconds between SSE deltas')
+    parser.add_argument('--drift-rate', type=float, default=0.0,
+                        help='Share of answers missing their vocabulary and questions sections')
+    parser.add_argument('--fixtures', help='Serve answers recorded with LINGUAFLOW_PROVIDER_MODE=record from this directory')
+    parser.add_argument('--seed', type=int, help='Seed latency and fault draws for repeatable runs')
+    args = parser.parse_args()
+
+    template = DEFAULT_TEMPLATE
+    if args.body_file:
+        with open(args.body_file, encoding='utf-8') as f:
+            template = f.read()
+
+    fixtures = None
+    if args.fixtures:
+        from ai_module import FixtureStore
+        fixtures = FixtureStore(args.fixtures)
+
+    provider = StandInProvider(
+        LatencyModel(args.latency, args.seed),
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_status.split(',')],
+        empty_rate=args.empty_rate,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        template=template,
+        chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay,
+        fixtures=fixtures,
+        seed=args.seed,
+        drift_rate=args.drift_rate
+    )
+
+    server = make_server(args.host, args.port, provider)
+    print(f"Stand-in providers on http://{args.host}:{server.server_port} "
+          f"(export LINGUAFLOW_PROVIDER_BASE_URL=http://{args.host}:{server.server_port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()